@@ -43,7 +43,7 @@ class Application(Adw.Application):
         return False  
     
     def _show_config_dialog(self, win):
-        dialog = ConfigureSourcesDialog(self.config, lambda: self._on_config_complete(win))
+        dialog = ConfigureSourcesDialog(self.config, lambda: self._on_config_complete(win), loader=win)
         dialog.present(win)
     
     def _on_config_complete(self, win):
@@ -0,0 +1,73 @@
+import heapq
+import itertools
+import time
+
+from gi.repository import GLib
+
+
+PRIORITY_TSV = 0
+PRIORITY_RAP = 1
+PRIORITY_PKG = 2
+
+BURST_SECONDS = 0.5
+GRANT_SECONDS = 0.1
+MIN_GRANT_SIZE = 4096
+
+
+_scheduler = None
+
+
+def get_scheduler(config):
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BandwidthScheduler(config)
+    return _scheduler
+
+
+class BandwidthScheduler:
+    
+    def __init__(self, config):
+        self.config = config
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.timeout_id = 0
+    
+    def request(self, size, priority, callback, *args):
+        limit = self.config.get_bandwidth_limit()
+        if limit <= 0 and not self.waiting:
+            callback(size, *args)
+            return
+        
+        if limit > 0:
+            size = min(size, max(int(limit * GRANT_SECONDS), MIN_GRANT_SIZE))
+        heapq.heappush(self.waiting, (priority, next(self.counter), size, callback, args))
+        self._dispatch()
+    
+    def refund(self, size):
+        limit = self.config.get_bandwidth_limit()
+        if size > 0 and limit > 0:
+            self.tokens = min(self.tokens + size, limit * BURST_SECONDS)
+    
+    def _dispatch(self):
+        limit = self.config.get_bandwidth_limit()
+        if limit > 0:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.updated) * limit, limit * BURST_SECONDS)
+            self.updated = now
+        
+        while self.waiting and (limit <= 0 or self.tokens >= 0):
+            priority, _, size, callback, args = heapq.heappop(self.waiting)
+            if limit > 0:
+                self.tokens -= size
+            callback(size, *args)
+        
+        if self.waiting and not self.timeout_id:
+            delay = max(int(-self.tokens / limit * 1000), 1)
+            self.timeout_id = GLib.timeout_add(delay, self._on_timeout)
+    
+    def _on_timeout(self):
+        self.timeout_id = 0
+        self._dispatch()
+        return False
@@ -0,0 +1,368 @@
+from array import array
+from bisect import insort
+from datetime import datetime
+from itertools import compress
+
+
+_BIT_TABLE = bytes.maketrans(b"01", b"\0\1")
+SORT_INCREMENTAL_MAX_FRACTION = 0.0625
+
+
+class StringColumn:
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("I", [0])
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].decode("utf-8", "replace")
+    
+    def get_bytes(self, row):
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]])
+    
+    def append(self, value):
+        self.data += value.encode("utf-8", "replace")
+        self.offsets.append(len(self.data))
+    
+    def extend_range(self, other, start, end):
+        delta = len(self.data) - other.offsets[start]
+        self.data += other.data[other.offsets[start]:other.offsets[end]]
+        self.offsets.extend([offset + delta for offset in other.offsets[start + 1:end + 1]])
+
+
+class CodedColumn:
+    
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+        self.codes = array("H")
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+    
+    def get_code(self, value):
+        return self.lookup.get(value)
+    
+    def _intern(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+        return code
+    
+    def append(self, value):
+        self.codes.append(self._intern(value))
+    
+    def extend_range(self, other, start, end):
+        mapping = [self._intern(value) for value in other.values]
+        self.codes.extend([mapping[code] for code in other.codes[start:end]])
+
+
+class Catalog:
+    
+    STRING_FIELDS = ("title_id", "name", "pkg_url", "rap", "content_id", "last_modified", "sha256")
+    CODED_FIELDS = ("region", "category", "platform")
+    
+    def __init__(self):
+        self.columns = {field: StringColumn() for field in self.STRING_FIELDS}
+        self.columns.update({field: CodedColumn() for field in self.CODED_FIELDS})
+        self.file_size = array("q")
+        self.alive = bytearray()
+        self.alive_count = 0
+    
+    def __len__(self):
+        return self.alive_count
+    
+    @property
+    def row_count(self):
+        return len(self.alive)
+    
+    def get(self, field, row):
+        if field == "file_size":
+            return self.file_size[row]
+        return self.columns[field][row]
+    
+    def entry(self, row):
+        return TsvEntry(self, row)
+    
+    def rows(self):
+        alive = self.alive
+        return [row for row in range(len(alive)) if alive[row]]
+    
+    def append_row(self, values, category, platform):
+        row = len(self.alive)
+        for field, value in values.items():
+            if field == "file_size":
+                self.file_size.append(_parse_size(value))
+            else:
+                self.columns[field].append(value)
+        self.columns["category"].append(category)
+        self.columns["platform"].append(platform)
+        self.alive.append(1)
+        self.alive_count += 1
+        return row
+    
+    def get_key(self, row):
+        return self.columns["content_id"].get_bytes(row), self.columns["title_id"].get_bytes(row)
+    
+    def same_row(self, row, other, other_row):
+        if self.file_size[row] != other.file_size[other_row]:
+            return False
+        for field, column in self.columns.items():
+            other_column = other.columns[field]
+            if isinstance(column, CodedColumn):
+                if column[row] != other_column[other_row]:
+                    return False
+            elif column.get_bytes(row) != other_column.get_bytes(other_row):
+                return False
+        return True
+    
+    def remove(self, row):
+        if self.alive[row]:
+            self.alive[row] = 0
+            self.alive_count -= 1
+    
+    def extend_range(self, other, start, end):
+        first = len(self.alive)
+        for field, column in self.columns.items():
+            column.extend_range(other.columns[field], start, end)
+        self.file_size.extend(other.file_size[start:end])
+        alive = other.alive[start:end]
+        self.alive += alive
+        self.alive_count += alive.count(1)
+        return range(first, len(self.alive))
+    
+    def extend_rows(self, other, rows):
+        new_rows = array("I")
+        for start, end in _row_ranges(rows):
+            new_rows.extend(self.extend_range(other, start, end))
+        return new_rows
+
+
+class FacetIndex:
+    
+    def __init__(self):
+        self.masks = {field: {} for field in Catalog.CODED_FIELDS}
+        self.alive = 0
+        self.size = 0
+    
+    def add_rows(self, catalog):
+        rows = [row for row in range(self.size, catalog.row_count) if catalog.alive[row]]
+        self.size = catalog.row_count
+        if not rows:
+            return
+        
+        self.alive |= rows_to_bits(rows)
+        for field, masks in self.masks.items():
+            column = catalog.columns[field]
+            grouped = {}
+            for row in rows:
+                code = column.codes[row]
+                if code not in grouped:
+                    grouped[code] = []
+                grouped[code].append(row)
+            for code, code_rows in grouped.items():
+                value = column.values[code]
+                masks[value] = masks.get(value, 0) | rows_to_bits(code_rows)
+    
+    def remove_rows(self, rows):
+        keep = ~rows_to_bits(rows)
+        self.alive &= keep
+        for masks in self.masks.values():
+            for value in masks:
+                masks[value] &= keep
+    
+    def get_mask(self, filters):
+        mask = self.alive
+        for field, value in filters.items():
+            if value and value != "all":
+                mask &= self.masks[field].get(value, 0)
+        return mask
+    
+    def get_counts(self, field, mask=None):
+        if mask is None:
+            mask = self.alive
+        return {value: (value_mask & mask).bit_count() for value, value_mask in self.masks[field].items()}
+    
+    def get_values(self, field, mask=None):
+        return {value for value, count in self.get_counts(field, mask).items() if count}
+
+
+class SortIndex:
+    
+    FIELDS = ("name", "title_id", "region", "platform", "category", "file_size", "last_modified")
+    
+    def __init__(self):
+        self.ranks = {}
+    
+    def update(self, catalog):
+        for field in self.FIELDS:
+            self._update_field(catalog, field)
+    
+    def _update_field(self, catalog, field):
+        rank = self.ranks.get(field)
+        size = len(rank) if rank is not None else 0
+        if rank is not None and size == catalog.row_count:
+            return rank
+        
+        key = self._get_key(catalog, field)
+        new_rows = range(size, catalog.row_count)
+        if rank is not None and len(new_rows) <= size * SORT_INCREMENTAL_MAX_FRACTION:
+            order = self._get_order(rank)
+            for row in sorted(new_rows, key=key):
+                insort(order, row, key=key)
+        else:
+            order = sorted(range(catalog.row_count), key=key)
+        
+        rank = array("I", bytes(4 * len(order)))
+        for position, row in enumerate(order):
+            rank[row] = position
+        self.ranks[field] = rank
+        return rank
+    
+    def _get_order(self, rank):
+        order = array("I", bytes(4 * len(rank)))
+        for row, position in enumerate(rank):
+            order[position] = row
+        return order
+    
+    def _get_key(self, catalog, field):
+        if field == "file_size":
+            return catalog.file_size.__getitem__
+        
+        column = catalog.columns[field]
+        if isinstance(column, CodedColumn):
+            order = sorted(range(len(column.values)), key=lambda code: column.values[code].casefold())
+            code_ranks = [0] * len(order)
+            for position, code in enumerate(order):
+                code_ranks[code] = position
+            return lambda row: code_ranks[column.codes[row]]
+        
+        if field == "last_modified":
+            return lambda row: _parse_date(column[row])
+        return lambda row: column[row].casefold()
+    
+    def sort(self, catalog, rows, field, descending=False, refresh=True):
+        if field not in self.FIELDS:
+            return rows
+        
+        rank = self.ranks.get(field)
+        if refresh or rank is None:
+            rank = self._update_field(catalog, field)
+        size = len(rank)
+        return sorted(rows, key=lambda row: rank[row] if row < size else row, reverse=descending)
+
+
+class TsvEntry:
+    
+    __slots__ = ("catalog", "row")
+    
+    FIELDS = (
+        ("title_id", "Title ID"),
+        ("region", "Region"),
+        ("name", "Name"),
+        ("pkg_url", "PKG direct link"),
+        ("rap", "RAP"),
+        ("content_id", "Content ID"),
+        ("last_modified", "Last Modification Date"),
+        ("file_size", "File Size"),
+        ("sha256", "SHA256"),
+    )
+    
+    def __init__(self, catalog, row):
+        self.catalog = catalog
+        self.row = row
+    
+    title_id = property(lambda self: self.catalog.columns["title_id"][self.row])
+    region = property(lambda self: self.catalog.columns["region"][self.row])
+    name = property(lambda self: self.catalog.columns["name"][self.row])
+    pkg_url = property(lambda self: self.catalog.columns["pkg_url"][self.row])
+    rap = property(lambda self: self.catalog.columns["rap"][self.row])
+    content_id = property(lambda self: self.catalog.columns["content_id"][self.row])
+    last_modified = property(lambda self: self.catalog.columns["last_modified"][self.row])
+    sha256 = property(lambda self: self.catalog.columns["sha256"][self.row])
+    category = property(lambda self: self.catalog.columns["category"][self.row])
+    platform = property(lambda self: self.catalog.columns["platform"][self.row])
+    
+    @property
+    def file_size(self):
+        size = self.catalog.file_size[self.row]
+        return str(size) if size >= 0 else ""
+    
+    def get_file_size(self):
+        return max(self.catalog.file_size[self.row], 0)
+    
+    def to_dict(self):
+        values = {attr: getattr(self, attr) for attr, _ in self.FIELDS}
+        values["category"] = self.category
+        values["platform"] = self.platform
+        return values
+    
+    @classmethod
+    def from_dict(cls, values):
+        catalog = Catalog()
+        row_values = {attr: values.get(attr, "") for attr, _ in cls.FIELDS}
+        row = catalog.append_row(row_values, values.get("category", ""), values.get("platform", ""))
+        return cls(catalog, row)
+    
+    def has_download(self):
+        return self.pkg_url and self.pkg_url.lower() not in ("missing", "")
+    
+    def get_file_size_formatted(self):
+        size = self.catalog.file_size[self.row]
+        if size < 0:
+            return "Unknown"
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024:
+                return f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} TB"
+
+
+def rows_to_bits(rows):
+    rows = list(rows)
+    if not rows:
+        return 0
+    data = bytearray(max(rows) // 8 + 1)
+    for row in rows:
+        data[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(data, "little")
+
+
+def bits_to_rows(bits):
+    flags = bin(bits)[:1:-1].encode("ascii").translate(_BIT_TABLE)
+    return list(compress(range(len(flags)), flags))
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return datetime.min
+
+
+def _parse_size(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else -1
+
+
+def _row_ranges(rows):
+    start = None
+    previous = None
+    for row in rows:
+        if start is None:
+            start = previous = row
+        elif row == previous + 1:
+            previous = row
+        else:
+            yield start, previous + 1
+            start = previous = row
+    if start is not None:
+        yield start, previous + 1
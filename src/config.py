@@ -27,6 +27,7 @@ class Config:
         self.app_config_dir = os.path.join(config_dir, "pkgharbor")
         self.tsv_cache_dir = os.path.join(self.app_config_dir, "tsv_cache")
         self.config_path = os.path.join(self.app_config_dir, "config.json")
+        self.snapshot_path = os.path.join(self.app_config_dir, "catalog.snapshot")
         self.config = self._load()
     
     def _load(self):
@@ -79,13 +80,88 @@ class Config:
         self.save()
     
     def get_tsv_cache_path(self, category, platform):
+        return os.path.join(self.tsv_cache_dir, f"{category}_{platform}.tsv.gz")
+    
+    def get_legacy_tsv_cache_path(self, category, platform):
         return os.path.join(self.tsv_cache_dir, f"{category}_{platform}.tsv")
     
+    def get_max_concurrent_downloads(self):
+        return self.config.get("max_concurrent_downloads", 2)
+    
+    def set_max_concurrent_downloads(self, count):
+        self.config["max_concurrent_downloads"] = count
+        self.save()
+    
+    def get_download_segments(self):
+        return self.config.get("download_segments", 4)
+    
+    def set_download_segments(self, count):
+        self.config["download_segments"] = count
+        self.save()
+    
+    def get_http_connections_per_host(self):
+        return self.config.get("http_connections_per_host", 8)
+    
+    def set_http_connections_per_host(self, count):
+        self.config["http_connections_per_host"] = count
+        self.save()
+    
+    def get_http_max_connections(self):
+        return self.config.get("http_max_connections", 32)
+    
+    def get_http_timeout(self):
+        return self.config.get("http_timeout", 30)
+    
+    def get_http_keepalive_timeout(self):
+        return self.config.get("http_keepalive_timeout", 90)
+    
+    def get_bandwidth_limit(self):
+        return self.config.get("bandwidth_limit", 0)
+    
+    def set_bandwidth_limit(self, limit):
+        self.config["bandwidth_limit"] = limit
+        self.save()
+    
+    def get_progress_update_rate(self):
+        return self.config.get("progress_update_rate", 0)
+    
+    def set_progress_update_rate(self, rate):
+        self.config["progress_update_rate"] = rate
+        self.save()
+    
+    def get_download_journal_path(self):
+        return os.path.join(self.app_config_dir, "downloads.json")
+    
+    def get_hash_cache_path(self):
+        return os.path.join(self.app_config_dir, "hashes.json")
+    
+    def get_max_concurrent_tsv_downloads(self):
+        return self.config.get("max_concurrent_tsv_downloads", 4)
+    
+    def set_max_concurrent_tsv_downloads(self, count):
+        self.config["max_concurrent_tsv_downloads"] = count
+        self.save()
+    
+    def get_parse_workers(self):
+        return self.config.get("parse_workers", os.cpu_count() or 1)
+    
+    def set_parse_workers(self, workers):
+        self.config["parse_workers"] = workers
+        self.save()
+    
+    def get_snapshot_path(self):
+        return self.snapshot_path
+    
+    def get_tsv_validators_path(self):
+        return os.path.join(self.tsv_cache_dir, "validators.json")
+    
     def get_cached_tsv_files(self):
         cached = []
         for category_key, category_info in self.TSV_STRUCTURE.items():
             for platform in category_info["options"]:
                 cache_path = self.get_tsv_cache_path(category_key, platform)
+                if not os.path.exists(cache_path):
+                    cache_path = self.get_legacy_tsv_cache_path(category_key, platform)
                 if os.path.exists(cache_path):
                     cached.append((category_key, platform, cache_path))
         return cached
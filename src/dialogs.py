@@ -10,10 +10,11 @@ from tsv_downloader import TsvDownloader
 
 class ConfigureSourcesDialog(Adw.Dialog):
     
-    def __init__(self, config, on_complete):
+    def __init__(self, config, on_complete, loader=None):
         super().__init__()
         self.config = config
         self.on_complete = on_complete
+        self.loader = loader
         self.entries = {}  
         self.downloader = TsvDownloader(config)
         self.is_downloading = False
@@ -157,6 +158,36 @@ class ConfigureSourcesDialog(Adw.Dialog):
         row.set_activatable_widget(browse_button)
         
         group.add(row)
+        
+        self.concurrent_row = Adw.SpinRow.new_with_range(1, 8, 1)
+        self.concurrent_row.set_title("Simultaneous Downloads")
+        self.concurrent_row.set_subtitle("How many PKG files to download at once")
+        self.concurrent_row.set_value(self.config.get_max_concurrent_downloads())
+        group.add(self.concurrent_row)
+        
+        self.segments_row = Adw.SpinRow.new_with_range(1, 16, 1)
+        self.segments_row.set_title("Connections per Download")
+        self.segments_row.set_subtitle("Split large PKG files across several connections")
+        self.segments_row.set_value(self.config.get_download_segments())
+        group.add(self.segments_row)
+        
+        self.pool_row = Adw.SpinRow.new_with_range(1, 32, 1)
+        self.pool_row.set_title("Connections per Server")
+        self.pool_row.set_subtitle("Kept open and shared by all downloads, applies after a restart")
+        self.pool_row.set_value(self.config.get_http_connections_per_host())
+        group.add(self.pool_row)
+        
+        self.bandwidth_row = Adw.SpinRow.new_with_range(0, 1000000, 100)
+        self.bandwidth_row.set_title("Bandwidth Limit (KB/s)")
+        self.bandwidth_row.set_subtitle("Shared by all downloads, source refreshes go first. 0 means unlimited")
+        self.bandwidth_row.set_value(self.config.get_bandwidth_limit() // 1024)
+        group.add(self.bandwidth_row)
+        
+        self.progress_rate_row = Adw.SpinRow.new_with_range(0, 60, 1)
+        self.progress_rate_row.set_title("Progress Updates per Second")
+        self.progress_rate_row.set_subtitle("0 refreshes download progress once per frame")
+        self.progress_rate_row.set_value(self.config.get_progress_update_rate())
+        group.add(self.progress_rate_row)
         return group
     
     def _create_refetch_group(self):
@@ -217,6 +248,12 @@ class ConfigureSourcesDialog(Adw.Dialog):
         download_dir = self.download_dir_label.get_label()
         if download_dir:
             self.config.set_download_directory(download_dir)
+        
+        self.config.set_max_concurrent_downloads(int(self.concurrent_row.get_value()))
+        self.config.set_download_segments(int(self.segments_row.get_value()))
+        self.config.set_http_connections_per_host(int(self.pool_row.get_value()))
+        self.config.set_bandwidth_limit(int(self.bandwidth_row.get_value()) * 1024)
+        self.config.set_progress_update_rate(int(self.progress_rate_row.get_value()))
     
     def _on_save_clicked(self, button):
         self._save_config()
@@ -231,13 +268,15 @@ class ConfigureSourcesDialog(Adw.Dialog):
             return
         
         self.is_downloading = True
+        self.file_progress = {}
         self._set_ui_downloading(True)
         
         self.downloader.download_all(
             on_progress=self._on_download_progress,
             on_file_complete=self._on_file_complete,
             on_all_complete=self._on_all_downloads_complete,
-            on_error=self._on_download_error
+            on_error=self._on_download_error,
+            on_data=self.loader.feed_tsv if self.loader else None
         )
     
     def _set_ui_downloading(self, downloading):
@@ -257,17 +296,24 @@ class ConfigureSourcesDialog(Adw.Dialog):
             self.refetch_button.set_label("Fetch Now")
     
     def _on_download_progress(self, current_file, file_index, total_files, bytes_downloaded, total_bytes):
-        self.progress_label.set_label(f"Downloading {current_file}\n({file_index}/{total_files})")
+        if total_bytes > 0:
+            self.file_progress[current_file] = min(bytes_downloaded / total_bytes, 1.0)
+        else:
+            self.file_progress.setdefault(current_file, 0.0)
+        
+        finished = sum(1 for fraction in self.file_progress.values() if fraction >= 1.0)
+        in_flight = len(self.file_progress) - finished
+        self.progress_label.set_label(
+            f"Downloading {current_file}\n({finished}/{total_files} done, {in_flight} in progress)"
+        )
         
         
         if total_files > 0:
-            file_progress = (file_index - 1) / total_files
-            if total_bytes > 0:
-                file_progress += (bytes_downloaded / total_bytes) / total_files
-            self.progress_bar.set_fraction(min(file_progress, 1.0))
+            self.progress_bar.set_fraction(min(sum(self.file_progress.values()) / total_files, 1.0))
     
     def _on_file_complete(self, category, platform, local_path):
-        pass  
+        if self.loader:
+            self.loader.finish_tsv(category, platform, local_path)
     
     def _on_all_downloads_complete(self):
         self.is_downloading = False
@@ -278,4 +324,7 @@ class ConfigureSourcesDialog(Adw.Dialog):
         self.on_complete()
     
     def _on_download_error(self, category, platform, error_message):
+        if self.loader:
+            self.loader.abort_tsv(category, platform)
+        self.file_progress[f"{category}/{platform}"] = 1.0
         self.progress_label.set_label(f"Error: {category}/{platform}\n{error_message}")
@@ -0,0 +1,695 @@
+import gi
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+from collections import deque
+
+gi.require_version("Soup", "3.0")
+from gi.repository import GLib, Gio, Soup
+
+from catalog import TsvEntry
+from http_client import get_session
+from bandwidth import get_scheduler, PRIORITY_RAP, PRIORITY_PKG
+from progress import ThroughputEstimator
+
+
+CHUNK_SIZE = 65536
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 32 * 1024 * 1024
+WRITE_BUFFER_LOW = 8 * 1024 * 1024
+SEGMENT_MIN_SIZE = 32 * 1024 * 1024
+JOURNAL_INTERVAL = 2.0
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class DownloadWriter:
+    
+    def __init__(self, on_written, on_error):
+        self.on_written = on_written
+        self.on_error = on_error
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending_bytes = 0
+        self.waiting = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def write(self, job, segment, data, offset):
+        with self.lock:
+            self.pending_bytes += len(data)
+        self.tasks.put(("write", job, segment, data, offset))
+    
+    def flush(self, job, work, callback, *args):
+        self.tasks.put(("flush", job, work, callback, args))
+    
+    def submit(self, work, *args):
+        self.tasks.put(("call", work, args))
+    
+    def wait(self, callback, *args):
+        with self.lock:
+            if self.pending_bytes > WRITE_BUFFER_SIZE:
+                self.waiting.append((callback, args))
+                return
+        callback(*args)
+    
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task[0] == "flush":
+                _, job, work, callback, args = task
+                if work:
+                    try:
+                        work(job)
+                    except Exception as e:
+                        print(f"Error finishing download {job['dest_path']}: {e}")
+                GLib.idle_add(callback, *args)
+                continue
+            if task[0] == "call":
+                _, work, args = task
+                try:
+                    work(*args)
+                except Exception as e:
+                    print(f"Error in download writer task: {e}")
+                continue
+            
+            _, job, segment, data, offset = task
+            if not job["write_error"]:
+                try:
+                    self._write(job["fd"], data, offset)
+                    self.on_written(job, segment, data, offset)
+                except Exception as e:
+                    job["write_error"] = str(e)
+                    GLib.idle_add(self.on_error, job, str(e))
+            
+            with self.lock:
+                self.pending_bytes -= len(data)
+                waiting = []
+                if self.pending_bytes <= WRITE_BUFFER_LOW:
+                    waiting, self.waiting = self.waiting, []
+            for callback, args in waiting:
+                GLib.idle_add(callback, *args)
+    
+    def _write(self, fd, data, offset):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+
+
+class DownloadHasher:
+    
+    def __init__(self, job):
+        self.job = job
+        self.sha256 = hashlib.sha256()
+        self.hashed = 0
+        self.digest = None
+        self.condition = threading.Condition()
+        self.finishing = False
+        self.stopping = False
+        self.callback = None
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def notify(self):
+        with self.condition:
+            self.condition.notify()
+    
+    def finish(self, callback, *args):
+        with self.condition:
+            if not self.finished:
+                self.callback = (callback, args)
+                self.finishing = True
+                self.condition.notify()
+                return
+        GLib.idle_add(callback, *args)
+    
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.thread.join()
+    
+    def _run(self):
+        try:
+            self._hash()
+        except Exception as e:
+            print(f"Error hashing {self.job['part_path']}: {e}")
+        
+        with self.condition:
+            self.finished = True
+            callback = self.callback
+        if callback:
+            GLib.idle_add(callback[0], *callback[1])
+    
+    def _hash(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopping:
+                        return
+                    size = self._get_available()
+                    if size or self.finishing:
+                        break
+                    self.condition.wait()
+            if not size:
+                break
+            
+            data = os.pread(self.job["fd"], min(size, HASH_BLOCK_SIZE), self.hashed)
+            if not data:
+                raise OSError(f"Unexpected end of file at {self.hashed}")
+            self.sha256.update(data)
+            self.hashed += len(data)
+        
+        self.digest = self.sha256.hexdigest()
+    
+    def _get_available(self):
+        for segment in self.job["segments"]:
+            if segment["start"] <= self.hashed and (segment["end"] is None or self.hashed < segment["end"]):
+                return max(segment["written"] - self.hashed, 0)
+        return 0
+
+
+class DownloadQueue:
+    
+    def __init__(self, config, on_changed, on_progress):
+        self.config = config
+        self.on_changed = on_changed
+        self.on_progress = on_progress
+        self.session = get_session(config)
+        self.bandwidth = get_scheduler(config)
+        self.jobs = {}
+        self.pending = deque()
+        self.active = 0
+        self.next_id = 1
+        self.journal_saved = 0.0
+        self.journal_lock = threading.Lock()
+        self.journal_version = 0
+        self.journal_written = 0
+        self.hashes = self._load_hashes()
+        self.writer = DownloadWriter(self._on_written, self._on_write_failed)
+    
+    def add(self, kind, entry, url, dest_path, total_size=0, front=False, segments=None, validator=None,
+            error=None):
+        job = {
+            "id": self.next_id,
+            "type": kind,
+            "entry": entry,
+            "url": url,
+            "dest_path": dest_path,
+            "part_path": dest_path + ".part",
+            "total_size": total_size,
+            "downloaded": sum(segment["position"] - segment["start"] for segment in segments or []),
+            "segments": segments,
+            "validator": validator,
+            "state": "queued",
+            "error": None,
+            "fd": None,
+            "write_error": None,
+            "cancellable": None,
+            "cancelled": False,
+            "speed": ThroughputEstimator(),
+            "hasher": None,
+            "sha256": None,
+            "verified": None,
+        }
+        self.next_id += 1
+        self.jobs[job["id"]] = job
+        if error:
+            job["state"] = "failed"
+            job["error"] = error
+            self.on_changed(job)
+        else:
+            self._enqueue(job, front)
+        return job
+    
+    def restore(self):
+        journal_path = self.config.get_download_journal_path()
+        if not os.path.exists(journal_path):
+            return
+        
+        try:
+            with open(journal_path, "r") as f:
+                journal = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading download journal {journal_path}: {e}")
+            return
+        
+        for item in journal:
+            segments = None
+            if os.path.exists(item["dest_path"] + ".part"):
+                segments = [self._create_segment(*segment) for segment in item["segments"]]
+            self.add(
+                item["type"],
+                TsvEntry.from_dict(item["entry"]),
+                item["url"],
+                item["dest_path"],
+                item["total_size"],
+                segments=segments,
+                validator=item["validator"],
+                error=item.get("error"),
+            )
+    
+    def find(self, dest_path):
+        for job in self.jobs.values():
+            if job["dest_path"] == dest_path and job["state"] in ("queued", "active", "closing", "failed"):
+                return job
+        return None
+    
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        
+        job["cancelled"] = True
+        if job["state"] == "active":
+            job["cancellable"].cancel()
+        elif job["state"] in ("queued", "failed"):
+            if job in self.pending:
+                self.pending.remove(job)
+            self._finish(job, "cancelled")
+    
+    def retry(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and job["state"] == "failed":
+            self._enqueue(job, False)
+    
+    def remove(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and job["state"] not in ("queued", "active", "closing"):
+            del self.jobs[job_id]
+    
+    def get_counts(self):
+        return self.active, len(self.pending)
+    
+    def get_speed(self, job):
+        if job["state"] != "active":
+            return 0.0
+        return job["speed"].get_rate()
+    
+    def get_eta(self, job):
+        if job["state"] != "active" or job["total_size"] <= 0:
+            return None
+        return job["speed"].get_eta(job["total_size"] - job["downloaded"])
+    
+    def get_throughput(self):
+        return sum(self.get_speed(job) for job in self.jobs.values())
+    
+    def get_cached_hash(self, path):
+        cached = self.hashes.get(path)
+        if not cached or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        if (cached["size"], cached["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return cached["sha256"]
+    
+    def _load_hashes(self):
+        hashes_path = self.config.get_hash_cache_path()
+        if os.path.exists(hashes_path):
+            try:
+                with open(hashes_path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return {}
+        return {}
+    
+    def _store_hash(self, path, sha256):
+        stat = os.stat(path)
+        self.hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        
+        hashes_path = self.config.get_hash_cache_path()
+        try:
+            os.makedirs(os.path.dirname(hashes_path), exist_ok=True)
+            tmp_path = hashes_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.hashes, f, indent=2)
+            os.replace(tmp_path, hashes_path)
+        except (IOError, OSError) as e:
+            print(f"Error saving hash cache {hashes_path}: {e}")
+    
+    def save_journal(self, wait=False):
+        journal = []
+        fds = []
+        for job in self.jobs.values():
+            if job["state"] not in ("queued", "active", "closing", "failed"):
+                continue
+            if job["fd"] is not None and job["state"] != "closing":
+                fds.append(job["fd"])
+            journal.append({
+                "type": job["type"],
+                "url": job["url"],
+                "dest_path": job["dest_path"],
+                "total_size": job["total_size"],
+                "validator": job["validator"],
+                "segments": [
+                    (segment["start"], segment["written"], segment["end"],
+                     segment["done"] and segment["written"] == segment["position"])
+                    for segment in job["segments"] or []
+                ],
+                "entry": job["entry"].to_dict(),
+                "error": job["error"] if job["state"] == "failed" else None,
+            })
+        
+        self.journal_saved = time.monotonic()
+        self.journal_version += 1
+        if wait:
+            self._write_journal(journal, fds, self.journal_version)
+        else:
+            self.writer.submit(self._write_journal, journal, fds, self.journal_version)
+    
+    def _write_journal(self, journal, fds, version):
+        journal_path = self.config.get_download_journal_path()
+        with self.journal_lock:
+            if version <= self.journal_written:
+                return
+            try:
+                for fd in fds:
+                    os.fsync(fd)
+                os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+                tmp_path = journal_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(journal, f, indent=2)
+                os.replace(tmp_path, journal_path)
+                self.journal_written = version
+            except (IOError, OSError) as e:
+                print(f"Error saving download journal {journal_path}: {e}")
+    
+    def _enqueue(self, job, front):
+        job["state"] = "queued"
+        job["error"] = None
+        if front:
+            self.pending.appendleft(job)
+        else:
+            self.pending.append(job)
+        
+        self.on_changed(job)
+        self.save_journal()
+        self._start_next()
+    
+    def _start_next(self):
+        while self.pending and self.active < self.config.get_max_concurrent_downloads():
+            self._start(self.pending.popleft())
+    
+    def _start(self, job):
+        job["state"] = "active"
+        job["speed"].reset()
+        job["cancellable"] = Gio.Cancellable()
+        job["write_error"] = None
+        if not job["segments"]:
+            job["segments"] = self._plan_segments(job)
+        self._rewind(job)
+        self.active += 1
+        self.on_changed(job)
+        
+        remaining = [segment for segment in job["segments"] if not segment["done"]]
+        if remaining:
+            self._send(job, remaining[0])
+            return
+        
+        try:
+            job["fd"] = os.open(job["part_path"], os.O_RDWR)
+            self._reset_hash(job)
+            self._finish(job, "done")
+        except OSError as e:
+            self._fail(job, str(e))
+    
+    def _rewind(self, job):
+        for segment in job["segments"]:
+            segment["done"] = segment["done"] and segment["written"] == segment["position"]
+            segment["position"] = segment["written"]
+        job["downloaded"] = sum(segment["written"] - segment["start"] for segment in job["segments"])
+    
+    def _plan_segments(self, job):
+        total_size = job["total_size"]
+        count = self.config.get_download_segments()
+        if job["type"] != "pkg" or count < 2 or total_size < SEGMENT_MIN_SIZE:
+            return [self._create_segment(0, 0, None)]
+        
+        size = -(-total_size // count)
+        return [
+            self._create_segment(start, start, min(start + size, total_size))
+            for start in range(0, total_size, size)
+        ]
+    
+    def _create_segment(self, start, position, end, done=False):
+        return {
+            "start": start,
+            "position": position,
+            "written": position,
+            "end": end,
+            "done": done,
+            "input_stream": None,
+            "read_size": CHUNK_SIZE,
+            "granted": 0,
+        }
+    
+    def _send(self, job, segment):
+        message = Soup.Message.new("GET", job["url"])
+        if message is None:
+            self._fail(job, f"Invalid URL: {job['url']}")
+            return
+        
+        if segment["end"] is not None or segment["position"]:
+            headers = message.get_request_headers()
+            headers.set_range(segment["position"], segment["end"] - 1 if segment["end"] is not None else -1)
+            if job["validator"]:
+                headers.replace("If-Range", job["validator"])
+        
+        self.session.send_async(
+            message,
+            GLib.PRIORITY_DEFAULT,
+            job["cancellable"],
+            self._on_send_complete,
+            job,
+            segment,
+            message
+        )
+    
+    def _on_send_complete(self, session, result, job, segment, message):
+        if job["state"] != "active":
+            return
+        
+        try:
+            segment["input_stream"] = session.send_finish(result)
+            status = message.get_status()
+            headers = message.get_response_headers()
+            first = job["fd"] is None
+            
+            if status == Soup.Status.PARTIAL_CONTENT:
+                if first:
+                    ranged, start, end, total_size = headers.get_content_range()
+                    if job["total_size"] and total_size != job["total_size"]:
+                        self._restart(job, total_size)
+                        return
+                    self._open_file(job, headers, False)
+                    for other in job["segments"]:
+                        if other is not segment and not other["done"]:
+                            self._send(job, other)
+            elif status == Soup.Status.OK and first:
+                if len(job["segments"]) > 1 or segment["end"] is not None:
+                    print(f"Range requests not supported for {job['url']}, using a single connection")
+                content_length = headers.get_content_length()
+                if content_length > 0:
+                    job["total_size"] = content_length
+                segment.update(start=0, position=0, written=0, end=None)
+                job["segments"] = [segment]
+                job["downloaded"] = 0
+                self._open_file(job, headers, True)
+            else:
+                self._fail(job, f"HTTP {status}: {message.get_reason_phrase()}")
+                return
+            
+            self._read_chunk(job, segment)
+        
+        except Exception as e:
+            self._fail(job, str(e))
+    
+    def _restart(self, job, total_size):
+        print(f"Remote size of {job['url']} changed, restarting the download")
+        for segment in job["segments"]:
+            self._close_stream(segment)
+        if os.path.exists(job["part_path"]):
+            os.remove(job["part_path"])
+        
+        job["total_size"] = total_size
+        job["downloaded"] = 0
+        job["validator"] = None
+        job["segments"] = self._plan_segments(job)
+        self._send(job, job["segments"][0])
+    
+    def _open_file(self, job, headers, truncate):
+        etag = headers.get_one("ETag")
+        job["validator"] = etag if etag and not etag.startswith("W/") else headers.get_one("Last-Modified")
+        
+        fresh = truncate or not job["downloaded"] or not os.path.exists(job["part_path"])
+        flags = os.O_RDWR | os.O_CREAT | (os.O_TRUNC if fresh else 0)
+        job["fd"] = os.open(job["part_path"], flags, 0o644)
+        self._reset_hash(job)
+        if fresh and len(job["segments"]) > 1:
+            os.ftruncate(job["fd"], job["total_size"])
+        self.save_journal()
+    
+    def _read_chunk(self, job, segment):
+        priority = PRIORITY_PKG if job["type"] == "pkg" else PRIORITY_RAP
+        self.bandwidth.request(segment["read_size"], priority, self._on_read_granted, job, segment)
+    
+    def _on_read_granted(self, size, job, segment):
+        if job["state"] != "active":
+            self.bandwidth.refund(size)
+            return
+        
+        segment["granted"] = size
+        segment["input_stream"].read_bytes_async(
+            size,
+            GLib.PRIORITY_DEFAULT,
+            job["cancellable"],
+            self._on_chunk_read,
+            job,
+            segment
+        )
+    
+    def _on_chunk_read(self, stream, result, job, segment):
+        if job["state"] != "active":
+            return
+        
+        try:
+            data = stream.read_bytes_finish(result).get_data()
+            self.bandwidth.refund(segment["granted"] - len(data))
+            
+            if data:
+                self._adapt_read_size(segment, len(data))
+                if segment["end"] is not None:
+                    data = data[:segment["end"] - segment["position"]]
+                self.writer.write(job, segment, data, segment["position"])
+                segment["position"] += len(data)
+                job["downloaded"] += len(data)
+                job["speed"].add(len(data))
+                self.on_progress(job)
+                if time.monotonic() - self.journal_saved >= JOURNAL_INTERVAL:
+                    self.save_journal()
+                
+                if segment["end"] is None or segment["position"] < segment["end"]:
+                    self.writer.wait(self._resume_read, job, segment)
+                    return
+            elif segment["end"] is not None:
+                self._fail(job, "Connection closed before the download finished")
+                return
+        
+        except Exception as e:
+            self._fail(job, str(e))
+            return
+        
+        segment["done"] = True
+        self._close_stream(segment)
+        if all(other["done"] for other in job["segments"]):
+            self._finish(job, "done")
+    
+    def _adapt_read_size(self, segment, size):
+        if size >= segment["granted"]:
+            segment["read_size"] = min(segment["read_size"] * 2, MAX_CHUNK_SIZE)
+        elif size < segment["granted"] // 4:
+            segment["read_size"] = max(segment["read_size"] // 2, MIN_CHUNK_SIZE)
+    
+    def _resume_read(self, job, segment):
+        if job["state"] == "active":
+            self._read_chunk(job, segment)
+        return False
+    
+    def _on_written(self, job, segment, data, offset):
+        segment["written"] = offset + len(data)
+        job["hasher"].notify()
+    
+    def _on_write_failed(self, job, error):
+        if job["state"] == "active":
+            self._fail(job, f"Write error: {error}")
+        return False
+    
+    def _reset_hash(self, job):
+        self._stop_hash(job)
+        job["hasher"] = DownloadHasher(job)
+    
+    def _stop_hash(self, job):
+        if job["hasher"]:
+            job["hasher"].stop()
+            job["hasher"] = None
+    
+    def _on_hashed(self, job, state, error):
+        job["sha256"] = job["hasher"].digest
+        job["hasher"] = None
+        expected = job["entry"].sha256.strip().lower() if job["type"] == "pkg" else ""
+        job["verified"] = job["sha256"] == expected if expected and job["sha256"] else None
+        self._complete(job, state, error)
+        return False
+    
+    def _close_stream(self, segment):
+        if segment["input_stream"]:
+            try:
+                segment["input_stream"].close(None)
+            except Exception:
+                pass
+            segment["input_stream"] = None
+    
+    def _fail(self, job, error):
+        if job["cancellable"]:
+            job["cancellable"].cancel()
+        self._finish(job, "failed", error)
+    
+    def _finish(self, job, state, error=None):
+        if job["state"] in ("done", "cancelled", "closing"):
+            return
+        if job["state"] == "active":
+            self.active -= 1
+        if state == "failed" and job["cancelled"]:
+            state = "cancelled"
+            error = None
+        
+        job["state"] = "closing"
+        self.on_changed(job)
+        for segment in job["segments"] or []:
+            self._close_stream(segment)
+        self.writer.flush(job, self._sync if state == "failed" else None, self._on_flushed, job, state, error)
+    
+    def _on_flushed(self, job, state, error):
+        if state == "done" and job["hasher"] and not job["write_error"]:
+            job["hasher"].finish(self._on_hashed, job, state, error)
+        else:
+            self._stop_hash(job)
+            self._complete(job, state, error)
+        return False
+    
+    def _sync(self, job):
+        if job["fd"] is not None:
+            os.fsync(job["fd"])
+    
+    def _complete(self, job, state, error):
+        if state == "done" and job["write_error"]:
+            state = "failed"
+            error = f"Write error: {job['write_error']}"
+        
+        try:
+            if job["fd"] is not None:
+                fd = job["fd"]
+                job["fd"] = None
+                os.close(fd)
+            if state == "done":
+                os.replace(job["part_path"], job["dest_path"])
+                if job["sha256"]:
+                    self._store_hash(job["dest_path"], job["sha256"])
+            elif state == "cancelled" and os.path.exists(job["part_path"]):
+                os.remove(job["part_path"])
+        except OSError as e:
+            state = "failed"
+            error = str(e)
+        
+        job["state"] = state
+        job["error"] = error
+        self.save_journal()
+        self.on_changed(job)
+        self._start_next()
+        return False
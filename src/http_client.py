@@ -0,0 +1,20 @@
+import gi
+
+gi.require_version("Soup", "3.0")
+from gi.repository import Soup
+
+
+_session = None
+
+
+def get_session(config):
+    global _session
+    if _session is None:
+        _session = Soup.Session(
+            max_conns=config.get_http_max_connections(),
+            max_conns_per_host=config.get_http_connections_per_host(),
+            timeout=config.get_http_timeout(),
+            idle_timeout=config.get_http_keepalive_timeout(),
+        )
+        _session.remove_feature_by_type(Soup.ContentDecoder)
+    return _session
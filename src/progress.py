@@ -0,0 +1,93 @@
+import time
+
+from gi.repository import GLib
+
+
+FALLBACK_RATE = 30
+SPEED_HALF_LIFE = 2.0
+SPEED_SAMPLE_INTERVAL = 0.25
+
+
+class ThroughputEstimator:
+    
+    def __init__(self, half_life=SPEED_HALF_LIFE):
+        self.half_life = half_life
+        self.reset()
+    
+    def reset(self):
+        self.rate = None
+        self.pending = 0
+        self.sampled = time.monotonic()
+    
+    def add(self, size):
+        self.pending += size
+    
+    def get_rate(self):
+        now = time.monotonic()
+        elapsed = now - self.sampled
+        if elapsed >= SPEED_SAMPLE_INTERVAL:
+            sample = self.pending / elapsed
+            if self.rate is None:
+                self.rate = sample
+            else:
+                self.rate += (1 - 0.5 ** (elapsed / self.half_life)) * (sample - self.rate)
+            self.pending = 0
+            self.sampled = now
+        return self.rate or 0.0
+    
+    def get_eta(self, remaining):
+        rate = self.get_rate()
+        if rate <= 0 or remaining <= 0:
+            return None
+        return remaining / rate
+
+
+class ProgressCoalescer:
+    
+    def __init__(self, callback, rate=0, widget=None):
+        self.callback = callback
+        self.rate = rate
+        self.widget = widget
+        self.updates = {}
+        self.source_id = None
+        self.ticking = False
+    
+    def mark(self, key, *args):
+        self.updates[key] = args
+        if self.source_id is None:
+            self._schedule()
+    
+    def discard(self, key):
+        self.updates.pop(key, None)
+    
+    def flush(self):
+        updates, self.updates = self.updates, {}
+        if updates:
+            self.callback(updates)
+    
+    def cancel(self):
+        self.updates.clear()
+        if self.source_id is None:
+            return
+        if self.ticking:
+            self.widget.remove_tick_callback(self.source_id)
+        else:
+            GLib.source_remove(self.source_id)
+        self.source_id = None
+    
+    def _schedule(self):
+        self.ticking = self.widget is not None and self.rate <= 0
+        if self.ticking:
+            self.source_id = self.widget.add_tick_callback(self._on_tick)
+        else:
+            self.source_id = GLib.timeout_add(int(1000 / (self.rate or FALLBACK_RATE)), self._on_timeout)
+    
+    def _on_tick(self, widget, frame_clock):
+        return self._on_timeout()
+    
+    def _on_timeout(self):
+        self.flush()
+        if self.updates:
+            return True
+        self.source_id = None
+        return False
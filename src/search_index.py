@@ -0,0 +1,136 @@
+import heapq
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+
+
+CANCEL_CHECK_INTERVAL = 4096
+FUZZY_CANDIDATE_FACTOR = 4
+POSTING_CACHE_SIZE = 256
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class SearchIndex:
+    
+    FIELDS = ("name", "title_id", "content_id")
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("I", [0])
+        self.postings = OrderedDict()
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getstate__(self):
+        return {"data": self.data, "offsets": self.offsets}
+    
+    def __setstate__(self, state):
+        self.data = state["data"]
+        self.offsets = state["offsets"]
+        self.postings = OrderedDict()
+    
+    def add_rows(self, catalog):
+        start = len(self.data)
+        columns = [catalog.columns[field] for field in self.FIELDS]
+        for row in range(len(self), catalog.row_count):
+            key = "\0".join(column[row] for column in columns).lower()
+            self.data += key.encode("utf-8", "replace")
+            self.data += b"\0"
+            self.offsets.append(len(self.data))
+        
+        for trigram, posting in self.postings.items():
+            self._scan(trigram, posting, start)
+    
+    def _scan(self, needle, rows, start=0, cancellable=None):
+        data = self.data
+        offsets = self.offsets
+        position = data.find(needle, start)
+        while position != -1:
+            row = bisect_right(offsets, position) - 1
+            rows.append(row)
+            position = data.find(needle, offsets[row + 1])
+            if cancellable and len(rows) % CANCEL_CHECK_INTERVAL == 0 and cancellable.is_cancelled():
+                raise QueryCancelled()
+        return rows
+    
+    def _get_posting(self, needle, cancellable=None):
+        posting = self.postings.get(needle)
+        if posting is not None:
+            self.postings.move_to_end(needle)
+            return posting
+        
+        posting = self._scan(needle, array("I"), cancellable=cancellable)
+        self.postings[needle] = posting
+        if len(self.postings) > POSTING_CACHE_SIZE:
+            self.postings.popitem(last=False)
+        return posting
+    
+    def _get_needle(self, text):
+        return text.lower().replace("\0", "").encode("utf-8", "replace")
+    
+    def search(self, text, cancellable=None):
+        needle = self._get_needle(text)
+        if not needle:
+            return list(range(len(self)))
+        return list(self._get_posting(needle, cancellable))
+    
+    def refine(self, rows, text, cancellable=None):
+        return self._filter(rows, self._get_needle(text), cancellable)
+    
+    def _filter(self, rows, needle, cancellable):
+        data = self.data
+        offsets = self.offsets
+        matches = []
+        for start in range(0, len(rows), CANCEL_CHECK_INTERVAL):
+            if cancellable and cancellable.is_cancelled():
+                raise QueryCancelled()
+            matches.extend([
+                row for row in rows[start:start + CANCEL_CHECK_INTERVAL]
+                if needle in data[offsets[row]:offsets[row + 1]]
+            ])
+        return matches
+    
+    def fuzzy_search(self, text, limit, allowed=None, cancellable=None):
+        needle = self._get_needle(text)
+        offsets = self.offsets
+        
+        if len(needle) < 3:
+            rows = self.search(text, cancellable)
+            if allowed is not None:
+                rows = [row for row in rows if row in allowed]
+            return heapq.nsmallest(limit, rows, key=lambda row: offsets[row + 1] - offsets[row])
+        
+        trigrams = _get_trigrams(needle)
+        counts = Counter()
+        for trigram in trigrams:
+            if cancellable and cancellable.is_cancelled():
+                raise QueryCancelled()
+            counts.update(self._get_posting(trigram, cancellable))
+        
+        minimum = max(1, len(trigrams) // 3)
+        candidates = (
+            (count, row) for row, count in counts.items()
+            if count >= minimum and (allowed is None or row in allowed)
+        )
+        best = heapq.nlargest(limit * FUZZY_CANDIDATE_FACTOR, candidates)
+        
+        scored = ((self._get_similarity(row, trigrams), -row) for _, row in best)
+        return [-row for _, row in heapq.nlargest(limit, scored)]
+    
+    def _get_similarity(self, row, trigrams):
+        key = self.data[self.offsets[row]:self.offsets[row + 1] - 1]
+        best = 0.0
+        for field in key.split(b"\0"):
+            field_trigrams = _get_trigrams(field)
+            if field_trigrams:
+                shared = len(trigrams & field_trigrams)
+                best = max(best, 2.0 * shared / (len(trigrams) + len(field_trigrams)))
+        return best
+
+
+def _get_trigrams(value):
+    return {bytes(value[i:i + 3]) for i in range(len(value) - 2)}
@@ -1,20 +1,34 @@
 import gi
+import os
+import json
+import zlib
+from collections import deque
 
 gi.require_version("Gtk", "4.0")
 gi.require_version("Soup", "3.0")
 from gi.repository import GLib, Gio, Soup
 
+from progress import ProgressCoalescer
+from http_client import get_session
+from bandwidth import get_scheduler, PRIORITY_TSV
+
+
+CHUNK_SIZE = 65536
+
 
 class TsvDownloader:
     
     def __init__(self, config):
         self.config = config
-        self.session = Soup.Session()
+        self.session = get_session(config)
+        self.bandwidth = get_scheduler(config)
         self.cancel = None
+        self.progress = None
     
-    def download_all(self, on_progress, on_file_complete, on_all_complete, on_error):
+    def download_all(self, on_progress, on_file_complete, on_all_complete, on_error, on_data=None):
         self.config.ensure_tsv_cache_dir()
         self.cancel = Gio.Cancellable()
+        self.validators = self._load_validators()
         
         
         downloads = []
@@ -27,7 +41,9 @@ class TsvDownloader:
                         "category": category_key,
                         "platform": platform,
                         "url": url.strip(),
-                        "local_path": local_path
+                        "local_path": local_path,
+                        "legacy_path": self.config.get_legacy_tsv_cache_path(category_key, platform),
+                        "index": len(downloads) + 1,
                     })
         
         if not downloads:
@@ -35,64 +51,222 @@ class TsvDownloader:
             return
         
         
-        self._download_next(downloads, 0, on_progress, on_file_complete, on_all_complete, on_error)
+        self.callbacks = (on_progress, on_file_complete, on_all_complete, on_error)
+        self.on_data = on_data
+        self.progress = ProgressCoalescer(self._on_progress_updates, self.config.get_progress_update_rate())
+        self.pending = deque(downloads)
+        self.total_files = len(downloads)
+        self.finished_files = 0
+        self.active = 0
+        self._start_next()
     
-    def _download_next(self, downloads, index, on_progress, on_file_complete, on_all_complete, on_error):
-        if self.cancel.is_cancelled():
-            return
-        
-        if index >= len(downloads):
-            on_all_complete()
-            return
-        
-        download = downloads[index]
-        total_files = len(downloads)
-        
+    def _start_next(self):
+        while self.pending and self.active < self.config.get_max_concurrent_tsv_downloads():
+            if self.cancel.is_cancelled():
+                return
+            self._start_download(self.pending.popleft())
+    
+    def _start_download(self, download):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
         
         message = Soup.Message.new("GET", download["url"])
         if message is None:
             on_error(download["category"], download["platform"], f"Invalid URL: {download['url']}")
-            self._download_next(downloads, index + 1, on_progress, on_file_complete, on_all_complete, on_error)
+            self._download_finished()
             return
         
         
-        on_progress(f"{download['category']}/{download['platform']}", index + 1, total_files, 0, 0)
+        headers = message.get_request_headers()
+        headers.replace("Accept-Encoding", "gzip")
+        
+        validators = self.validators.get(self._get_name(download), {})
+        if validators.get("url") == download["url"] and os.path.exists(download["local_path"]):
+            if validators.get("etag"):
+                headers.replace("If-None-Match", validators["etag"])
+            if validators.get("last_modified"):
+                headers.replace("If-Modified-Since", validators["last_modified"])
+        
+        
+        self.active += 1
+        self._report_progress(download, 0, 0, True)
         
         
-        self.session.send_and_read_async(
+        self.session.send_async(
             message,
             GLib.PRIORITY_DEFAULT,
             self.cancel,
-            lambda session, result: self._on_download_complete(
-                session, result, message, download, downloads, index,
-                on_progress, on_file_complete, on_all_complete, on_error
-            )
+            self._on_send_complete,
+            message,
+            download
         )
     
-    def _on_download_complete(self, session, result, message, download, downloads, index,
-                               on_progress, on_file_complete, on_all_complete, on_error):
+    def _get_name(self, download):
+        return f"{download['category']}/{download['platform']}"
+    
+    def _on_send_complete(self, session, result, message, download):
         try:
-            bytes_data = session.send_and_read_finish(result)
+            input_stream = session.send_finish(result)
+            
+            if message.get_status() == Soup.Status.NOT_MODIFIED:
+                input_stream.close(None)
+                self._download_not_modified(download)
+                return
             
             if message.get_status() != Soup.Status.OK:
-                on_error(download["category"], download["platform"], 
-                        f"HTTP {message.get_status()}: {message.get_reason_phrase()}")
-            else:
-                
-                data = bytes_data.get_data()
-                with open(download["local_path"], "wb") as f:
-                    f.write(data)
-                
-                on_progress(f"{download['category']}/{download['platform']}", 
-                           index + 1, len(downloads), len(data), len(data))
-                on_file_complete(download["category"], download["platform"], download["local_path"])
+                input_stream.close(None)
+                self._download_failed(download, f"HTTP {message.get_status()}: {message.get_reason_phrase()}")
+                return
+            
+            download["message"] = message
+            download["input_stream"] = input_stream
+            download["total_size"] = max(message.get_response_headers().get_content_length(), 0)
+            download["downloaded"] = 0
+            download["tmp_path"] = download["local_path"] + ".part"
+            download["file"] = open(download["tmp_path"], "wb")
+            
+            content_encoding = (message.get_response_headers().get_one("Content-Encoding") or "").strip().lower()
+            if content_encoding not in ("gzip", "x-gzip"):
+                download["compressor"] = zlib.compressobj(wbits=31)
+            
+            self._read_chunk(download)
         
         except Exception as e:
-            on_error(download["category"], download["platform"], str(e))
+            self._download_failed(download, str(e))
+    
+    def _read_chunk(self, download):
+        self.bandwidth.request(CHUNK_SIZE, PRIORITY_TSV, self._on_read_granted, download)
+    
+    def _on_read_granted(self, size, download):
+        download["granted"] = size
+        download["input_stream"].read_bytes_async(
+            size,
+            GLib.PRIORITY_DEFAULT,
+            self.cancel,
+            self._on_chunk_read,
+            download
+        )
+    
+    def _on_chunk_read(self, stream, result, download):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
         
+        try:
+            data = stream.read_bytes_finish(result).get_data()
+            self.bandwidth.refund(download["granted"] - len(data))
+            
+            if data:
+                download["file"].write(self._compress(download, data))
+                download["downloaded"] += len(data)
+                if self.on_data:
+                    self.on_data(download["category"], download["platform"], data)
+                self._report_progress(download, download["downloaded"], download["total_size"])
+                self._read_chunk(download)
+                return
+            
+            
+            if download.get("compressor"):
+                download["file"].write(download["compressor"].flush())
+            download["file"].close()
+            stream.close(None)
+            os.replace(download["tmp_path"], download["local_path"])
+            if os.path.exists(download["legacy_path"]):
+                os.remove(download["legacy_path"])
+            self._store_validators(download)
+            
+            self._report_progress(download, download["downloaded"], download["downloaded"], True)
+            on_file_complete(download["category"], download["platform"], download["local_path"])
+        
+        except Exception as e:
+            self._download_failed(download, str(e))
+            return
+        
+        self.active -= 1
+        self._download_finished()
+    
+    def _report_progress(self, download, downloaded, total_size, immediate=False):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
+        
+        name = self._get_name(download)
+        args = (name, download["index"], self.total_files, downloaded, total_size)
+        if immediate:
+            self.progress.discard(name)
+            on_progress(*args)
+        else:
+            self.progress.mark(name, *args)
+    
+    def _on_progress_updates(self, updates):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
+        
+        for args in updates.values():
+            on_progress(*args)
+    
+    def _compress(self, download, data):
+        compressor = download.get("compressor")
+        return compressor.compress(data) if compressor else data
+    
+    def _download_not_modified(self, download):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
+        
+        self._report_progress(download, 1, 1, True)
+        on_file_complete(download["category"], download["platform"], download["local_path"])
+        self.active -= 1
+        self._download_finished()
+    
+    def _load_validators(self):
+        validators_path = self.config.get_tsv_validators_path()
+        if os.path.exists(validators_path):
+            try:
+                with open(validators_path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return {}
+        return {}
+    
+    def _store_validators(self, download):
+        headers = download["message"].get_response_headers()
+        self.validators[self._get_name(download)] = {
+            "url": download["url"],
+            "etag": headers.get_one("ETag"),
+            "last_modified": headers.get_one("Last-Modified"),
+        }
+        
+        validators_path = self.config.get_tsv_validators_path()
+        tmp_path = validators_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.validators, f, indent=2)
+        os.replace(tmp_path, validators_path)
+    
+    def _download_failed(self, download, error_message):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
+        
+        if download.get("file"):
+            download["file"].close()
+        if download.get("input_stream"):
+            try:
+                download["input_stream"].close(None)
+            except Exception:
+                pass
+        if download.get("tmp_path") and os.path.exists(download["tmp_path"]):
+            os.remove(download["tmp_path"])
         
-        self._download_next(downloads, index + 1, on_progress, on_file_complete, on_all_complete, on_error)
+        self.progress.discard(self._get_name(download))
+        on_error(download["category"], download["platform"], error_message)
+        self.active -= 1
+        self._download_finished()
+    
+    def _download_finished(self):
+        on_progress, on_file_complete, on_all_complete, on_error = self.callbacks
+        
+        self.finished_files += 1
+        if self.cancel.is_cancelled():
+            return
+        
+        if self.finished_files >= self.total_files:
+            on_all_complete()
+        else:
+            self._start_next()
     
     def cancel_downloads(self):
         if self.cancel:
             self.cancel.cancel()
+        if self.progress:
+            self.progress.cancel()
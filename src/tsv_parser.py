@@ -1,104 +1,505 @@
+import io
 import os
 import csv
+import gzip
+import time
+import zlib
+import pickle
+import hashlib
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
+from catalog import Catalog, FacetIndex, SortIndex, TsvEntry, bits_to_rows, rows_to_bits
+from search_index import SearchIndex
+
+
+SNAPSHOT_VERSION = 7
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+COMPACT_MIN_DEAD_FRACTION = 0.25
+STREAM_PUBLISH_INTERVAL = 0.25
+GZIP_MAGIC = b"\x1f\x8b"
+REFINE_MAX_FRACTION = 0.25
+FUZZY_RESULT_LIMIT = 200
+
+
+def _open_tsv(path):
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def _parse_tsv_file(path, category, platform):
+    started = time.perf_counter()
+    catalog = Catalog()
+    try:
+        with _open_tsv(path) as f:
+            reader = csv.reader(f, delimiter="\t")
+            indices = _get_indices(next(reader, []))
+            for row in reader:
+                if row:
+                    catalog.append_row(_get_values(row, indices), category, platform)
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+    return catalog, time.perf_counter() - started
+
+
+def _get_indices(header):
+    return [(attr, header.index(column) if column in header else None) for attr, column in TsvEntry.FIELDS]
 
-class TsvEntry:
-    
-    def __init__(self, data, category, platform):
-        self.title_id = data.get("Title ID", "")
-        self.region = data.get("Region", "")
-        self.name = data.get("Name", "")
-        self.pkg_url = data.get("PKG direct link", "")
-        self.rap = data.get("RAP", "")
-        self.content_id = data.get("Content ID", "")
-        self.last_modified = data.get("Last Modification Date", "")
-        self.file_size = data.get("File Size", "")
-        self.sha256 = data.get("SHA256", "")
-        self.category = category  
-        self.platform = platform  
-    
-    def has_download(self):
-        return self.pkg_url and self.pkg_url.lower() not in ("missing", "")
-    
-    def get_file_size_formatted(self):
-        try:
-            size = int(self.file_size)
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if size < 1024:
-                    return f"{size:.1f} {unit}"
-                size /= 1024
-            return f"{size:.1f} TB"
-        except (ValueError, TypeError):
-            return self.file_size or "Unknown"
+
+def _get_values(row, indices):
+    return {attr: row[index] if index is not None and index < len(row) else "" for attr, index in indices}
+
+
+class _TsvStream:
+    
+    def __init__(self):
+        self.compressed = None
+        self.decompressor = None
+        self.pending = b""
+        self.buffer = b""
+        self.indices = None
+        self.rows = array("I")
+        self.started = time.perf_counter()
+    
+    def feed(self, data):
+        if self.compressed is None:
+            self.pending += data
+            if len(self.pending) < len(GZIP_MAGIC):
+                return []
+            self.compressed = self.pending.startswith(GZIP_MAGIC)
+            if self.compressed:
+                self.decompressor = zlib.decompressobj(wbits=31)
+            data, self.pending = self.pending, b""
+        
+        if self.compressed:
+            data = self.decompressor.decompress(data)
+        return self._parse(self.buffer + data, False)
+    
+    def close(self):
+        data = self.pending
+        if self.compressed:
+            data = self.decompressor.flush()
+        return self._parse(self.buffer + data, True)
+    
+    def _parse(self, data, final):
+        end = len(data) if final else data.rfind(b"\n") + 1
+        self.buffer = data[end:]
+        if not end:
+            return []
+        
+        text = io.StringIO(data[:end].decode("utf-8", "replace"), newline="")
+        reader = csv.reader(text, delimiter="\t")
+        if self.indices is None:
+            self.indices = _get_indices(next(reader, []))
+        return [_get_values(row, self.indices) for row in reader if row]
 
 
 class TsvParser:
     
     def __init__(self, config):
         self.config = config
-        self.entries = []
+        self.catalog = Catalog()
+        self.search_index = SearchIndex()
+        self.facets = FacetIndex()
+        self.sort_index = SortIndex()
+        self.files = {}
+        self.new_bits = 0
+        self.load_timings = {}
+        self.streams = {}
+        self._stream_published = 0.0
+        self._unsaved = False
+        self._search_bits = (None, 0)
+        self._last_query = None
+    
+    def load_all(self, parallel=None):
+        for key in list(self.streams):
+            self.abort_stream(key)
+        
+        sources = self._get_sources()
+        if not self.files:
+            self._load_snapshot()
+        changed = self._unsaved
+        
+        source_keys = [(category_key, platform) for category_key, platform, _ in sources]
+        for key in [key for key in self.files if key not in source_keys]:
+            self._remove_file(key)
+            changed = True
+        
+        pending = []
+        for category_key, platform, cache_path in sources:
+            key = (category_key, platform)
+            stat = os.stat(cache_path)
+            known = self.files.get(key)
+            
+            if known and (known["size"], known["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            
+            digest = self._get_digest(cache_path)
+            if known and known["digest"] == digest:
+                known["size"] = stat.st_size
+                known["mtime_ns"] = stat.st_mtime_ns
+                changed = True
+                continue
+            
+            pending.append((key, cache_path, {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "digest": digest,
+            }))
+        
+        self.load_timings = {}
+        new_rows = []
+        for (key, cache_path, file_info), (chunk, elapsed) in zip(pending, self._parse_files(pending, parallel)):
+            if key in self.files:
+                file_info["rows"], diff = self._apply_diff(key, chunk)
+                new_rows.extend(diff["inserted"])
+                print(f"Updated {cache_path}: {len(diff['inserted'])} inserted, {len(diff['updated'])} updated, "
+                      f"{len(diff['deleted'])} deleted in {elapsed:.2f}s")
+            else:
+                file_info["rows"] = array("I", self.catalog.extend_range(chunk, 0, chunk.row_count))
+                print(f"Parsed {cache_path}: {len(chunk)} entries in {elapsed:.2f}s")
+            self.files[key] = file_info
+            self.load_timings[key] = elapsed
+            changed = True
+        
+        if pending:
+            self.new_bits = rows_to_bits(new_rows)
+        
+        dead = self.catalog.row_count - self.catalog.alive_count
+        if dead and (not self.catalog.alive_count or dead >= self.catalog.row_count * COMPACT_MIN_DEAD_FRACTION):
+            self._compact()
+        self._update_indexes()
+        self.sort_index.update(self.catalog)
+        if changed:
+            self._save_snapshot()
+            self._unsaved = False
+        return self.catalog
+    
+    def _update_indexes(self):
+        self.search_index.add_rows(self.catalog)
+        self.facets.add_rows(self.catalog)
+        self._search_bits = (None, 0)
+        self._last_query = None
+    
+    def feed_stream(self, key, data):
+        stream = self.streams.get(key)
+        if stream is None:
+            if key in self.files:
+                return False
+            stream = self.streams[key] = _TsvStream()
+        
+        category, platform = key
+        values = stream.feed(data)
+        for row_values in values:
+            stream.rows.append(self.catalog.append_row(row_values, category, platform))
+        return bool(values) and self._publish_streams()
     
-    def load_all(self):
-        self.entries = []
+    def finish_stream(self, key, cache_path):
+        stream = self.streams.pop(key, None)
+        if stream is None:
+            return False
         
-        for category_key, category_info in self.config.TSV_STRUCTURE.items():
-            for platform in category_info["options"]:
-                cache_path = self.config.get_tsv_cache_path(category_key, platform)
-                if os.path.exists(cache_path):
-                    self._load_file(cache_path, category_key, platform)
+        category, platform = key
+        for values in stream.close():
+            stream.rows.append(self.catalog.append_row(values, category, platform))
         
-        return self.entries
+        stat = os.stat(cache_path)
+        self.files[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": self._get_digest(cache_path),
+            "rows": stream.rows,
+        }
+        self.load_timings[key] = time.perf_counter() - stream.started
+        self._unsaved = True
+        print(f"Streamed {cache_path}: {len(stream.rows)} entries in {self.load_timings[key]:.2f}s")
+        return self._publish_streams(True)
+    
+    def abort_stream(self, key):
+        stream = self.streams.pop(key, None)
+        if stream is None:
+            return False
+        
+        for row in stream.rows:
+            self.catalog.remove(row)
+        self.facets.remove_rows(stream.rows)
+        return self._publish_streams(True)
+    
+    def _publish_streams(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self._stream_published < STREAM_PUBLISH_INTERVAL:
+            return False
+        self._stream_published = now
+        self._update_indexes()
+        return True
+    
+    def _get_sources(self):
+        return self.config.get_cached_tsv_files()
     
-    def _load_file(self, path, category, platform):
+    def _get_source_keys(self):
+        return [
+            (category_key, platform)
+            for category_key, category_info in self.config.TSV_STRUCTURE.items()
+            for platform in category_info["options"]
+        ]
+    
+    def _get_digest(self, path):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _apply_diff(self, key, chunk):
+        previous = {}
+        for row in reversed(self.files[key]["rows"]):
+            row_key = self.catalog.get_key(row)
+            if row_key not in previous:
+                previous[row_key] = []
+            previous[row_key].append(row)
+        
+        rows = array("I")
+        changed = []
+        positions = []
+        inserted = []
+        updated = []
+        deleted = []
+        for chunk_row in range(chunk.row_count):
+            candidates = previous.get(chunk.get_key(chunk_row))
+            if candidates:
+                row = candidates.pop()
+                if self.catalog.same_row(row, chunk, chunk_row):
+                    rows.append(row)
+                    continue
+                updated.append(len(changed))
+                deleted.append(row)
+            else:
+                inserted.append(len(changed))
+            changed.append(chunk_row)
+            positions.append(len(rows))
+            rows.append(0)
+        
+        removed = [row for candidates in previous.values() for row in candidates]
+        for row in deleted + removed:
+            self.catalog.remove(row)
+        self.facets.remove_rows(deleted + removed)
+        
+        new_rows = self.catalog.extend_rows(chunk, changed)
+        for position, row in zip(positions, new_rows):
+            rows[position] = row
+        
+        diff = {
+            "inserted": [new_rows[index] for index in inserted],
+            "updated": [new_rows[index] for index in updated],
+            "deleted": removed,
+        }
+        return rows, diff
+    
+    def _remove_file(self, key):
+        file_info = self.files.pop(key, None)
+        if file_info:
+            for row in file_info["rows"]:
+                self.catalog.remove(row)
+            self.facets.remove_rows(file_info["rows"])
+    
+    def _compact(self):
+        catalog = Catalog()
+        mapping = {}
+        for key in self._get_source_keys():
+            if key in self.files:
+                file_info = self.files[key]
+                rows = catalog.extend_rows(self.catalog, file_info["rows"])
+                mapping.update(zip(file_info["rows"], rows))
+                file_info["rows"] = rows
+        self.new_bits = rows_to_bits(mapping[row] for row in bits_to_rows(self.new_bits) if row in mapping)
+        self.catalog = catalog
+        self.search_index = SearchIndex()
+        self.facets = FacetIndex()
+        self.sort_index = SortIndex()
+    
+    def _parse_files(self, pending, parallel):
+        paths = [cache_path for _, cache_path, _ in pending]
+        categories = [category for (category, _), _, _ in pending]
+        platforms = [platform for (_, platform), _, _ in pending]
+        workers = min(self.config.get_parse_workers(), len(paths))
+        
+        if parallel is None:
+            parallel = workers > 1 and sum(file_info["size"] for _, _, file_info in pending) >= PARALLEL_MIN_BYTES
+        
+        if parallel and workers > 1:
+            try:
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    return list(executor.map(_parse_tsv_file, paths, categories, platforms))
+            except Exception as e:
+                print(f"Parallel parsing failed, falling back to a single process: {e}")
+        
+        return [_parse_tsv_file(*args) for args in zip(paths, categories, platforms)]
+    
+    def _load_snapshot(self):
+        snapshot_path = self.config.get_snapshot_path()
+        if not os.path.exists(snapshot_path):
+            return False
+        
         try:
-            with open(path, "r", encoding="utf-8", errors="replace") as f:
-                reader = csv.DictReader(f, delimiter="\t")
-                for row in reader:
-                    entry = TsvEntry(row, category, platform)
-                    self.entries.append(entry)
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.loads(f.read())
+            
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                return False
+            
+            self.catalog = snapshot["catalog"]
+            self.search_index = snapshot["search_index"]
+            self.facets = snapshot["facets"]
+            self.sort_index = snapshot["sort_index"]
+            self.files = snapshot["files"]
+            self.new_bits = snapshot["new_bits"]
+            return True
         except Exception as e:
-            print(f"Error loading {path}: {e}")
+            print(f"Error loading snapshot {snapshot_path}: {e}")
+            self.catalog = Catalog()
+            self.search_index = SearchIndex()
+            self.facets = FacetIndex()
+            self.sort_index = SortIndex()
+            self.files = {}
+            self.new_bits = 0
+            return False
     
-    def get_entries(self, category_filter=None, platform_filter=None, search_text=None, region_filter=None):
-        results = self.entries
-        
-        if category_filter and category_filter != "all":
-            results = [e for e in results if e.category == category_filter]
+    def _save_snapshot(self):
+        snapshot_path = self.config.get_snapshot_path()
         
-        if platform_filter and platform_filter != "all":
-            results = [e for e in results if e.platform == platform_filter]
+        try:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "catalog": self.catalog,
+                "search_index": self.search_index,
+                "facets": self.facets,
+                "sort_index": self.sort_index,
+                "files": self.files,
+                "new_bits": self.new_bits,
+            }
+            
+            os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+            os.replace(tmp_path, snapshot_path)
+        except Exception as e:
+            print(f"Error saving snapshot {snapshot_path}: {e}")
+    
+    def _get_search_bits(self, search_text, cancellable=None):
+        previous_text, previous_bits = self._search_bits
+        if previous_text == search_text:
+            return previous_bits
         
-        if region_filter and region_filter != "all":
-            results = [e for e in results if e.region == region_filter]
+        refinable = previous_bits.bit_count() <= len(self.search_index) * REFINE_MAX_FRACTION
+        if previous_text and previous_text.lower() in search_text.lower() and refinable:
+            rows = self.search_index.refine(bits_to_rows(previous_bits), search_text, cancellable)
+        else:
+            rows = self.search_index.search(search_text, cancellable)
         
+        bits = rows_to_bits(rows)
+        self._search_bits = (search_text, bits)
+        return bits
+    
+    def _get_filter_mask(self, filters):
+        mask = self.facets.get_mask({field: value for field, value in filters.items() if field != "new"})
+        if filters.get("new"):
+            mask &= self.new_bits
+        return mask
+    
+    def _get_mask(self, filters, search_text=None, cancellable=None):
+        mask = self._get_filter_mask(filters)
         if search_text:
-            search_lower = search_text.lower()
-            results = [e for e in results if 
-                      search_lower in e.name.lower() or 
-                      search_lower in e.title_id.lower() or
-                      search_lower in e.content_id.lower()]
+            mask &= self._get_search_bits(search_text, cancellable)
+        return mask
+    
+    def _is_refinement(self, previous, current):
+        if previous["search_text"] and previous["search_text"].lower() not in current["search_text"].lower():
+            return False
+        for field, value in previous["filters"].items():
+            if value and value != "all" and value != current["filters"][field]:
+                return False
+        return True
+    
+    def query(self, category_filter=None, platform_filter=None, search_text=None, region_filter=None, cancellable=None,
+              new_only=False):
+        search_text = search_text or ""
+        current = {
+            "filters": {"category": category_filter, "platform": platform_filter, "region": region_filter, "new": new_only},
+            "search_text": search_text,
+        }
+        previous = self._last_query
+        
+        if previous and self._is_refinement(previous, current):
+            mask = previous["mask"]
+            for field, value in current["filters"].items():
+                if value != previous["filters"][field]:
+                    mask &= self._get_filter_mask({field: value})
+            if search_text and search_text != previous["search_text"]:
+                if mask.bit_count() <= len(self.search_index) * REFINE_MAX_FRACTION:
+                    mask = rows_to_bits(self.search_index.refine(bits_to_rows(mask), search_text, cancellable))
+                else:
+                    mask &= self._get_search_bits(search_text, cancellable)
+        else:
+            mask = self._get_mask(current["filters"], search_text, cancellable)
         
-        return results
+        current["mask"] = mask
+        self._last_query = current
+        return bits_to_rows(mask)
     
-    def get_available_platforms(self, category_filter=None):
-        platforms = set()
-        for entry in self.entries:
-            if category_filter and category_filter != "all":
-                if entry.category == category_filter:
-                    platforms.add(entry.platform)
+    def fuzzy_query(self, category_filter=None, platform_filter=None, search_text=None, region_filter=None,
+                    limit=FUZZY_RESULT_LIMIT, cancellable=None, new_only=False):
+        search_text = search_text or ""
+        if not search_text:
+            return self.query(category_filter, platform_filter, search_text, region_filter, cancellable, new_only)
+        
+        filters = {"category": category_filter, "platform": platform_filter, "region": region_filter, "new": new_only}
+        mask = self._get_filter_mask(filters)
+        allowed = None
+        if mask != self.facets.alive or self.catalog.alive_count < self.catalog.row_count:
+            allowed = set(bits_to_rows(mask))
+        return self.search_index.fuzzy_search(search_text, limit, allowed, cancellable)
+    
+    def sort_rows(self, rows, field, descending=False):
+        return self.sort_index.sort(self.catalog, rows, field, descending, refresh=not self.streams)
+    
+    def get_entries(self, category_filter=None, platform_filter=None, search_text=None, region_filter=None, cancellable=None,
+                    new_only=False):
+        rows = self.query(category_filter, platform_filter, search_text, region_filter, cancellable, new_only)
+        return [TsvEntry(self.catalog, row) for row in rows]
+    
+    def get_facet_counts(self, category_filter=None, platform_filter=None, search_text=None, region_filter=None,
+                         cancellable=None, new_only=False, rows=None):
+        filters = {"category": category_filter, "platform": platform_filter, "region": region_filter, "new": new_only}
+        row_bits = rows_to_bits(rows) if rows is not None else None
+        counts = {}
+        for field in filters:
+            others = {other: value for other, value in filters.items() if other != field}
+            if row_bits is not None:
+                mask = row_bits & self._get_filter_mask(others)
             else:
-                platforms.add(entry.platform)
-        return sorted(platforms)
+                mask = self._get_mask(others, search_text, cancellable)
+            if field == "new":
+                counts[field] = (mask & self.new_bits).bit_count()
+                continue
+            counts[field] = self.facets.get_counts(field, mask)
+            counts[field]["all"] = mask.bit_count()
+        return counts
+    
+    def get_new_count(self):
+        return (self.new_bits & self.facets.alive).bit_count()
+    
+    def get_available_platforms(self, category_filter=None):
+        mask = self.facets.get_mask({"category": category_filter})
+        return sorted(self.facets.get_values("platform", mask))
     
     def get_available_categories(self):
-        categories = set()
-        for entry in self.entries:
-            categories.add(entry.category)
-        return sorted(categories)
+        return sorted(self.facets.get_values("category"))
     
     def get_available_regions(self):
-        regions = set()
-        for entry in self.entries:
-            if entry.region:
-                regions.add(entry.region)
-        return sorted(regions)
+        return sorted(region for region in self.facets.get_values("region") if region)
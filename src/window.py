@@ -1,13 +1,21 @@
 import gi
 import os
+import threading
+from collections import OrderedDict
 
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-gi.require_version("Soup", "3.0")
-from gi.repository import Gtk, Adw, Gio, GObject, Pango, GLib, Soup
+from gi.repository import Gtk, Adw, Gio, GObject, Pango, GLib
 
 from config import Config
 from tsv_parser import TsvParser, TsvEntry
+from search_index import QueryCancelled
+from download_queue import DownloadQueue
+from progress import ProgressCoalescer
+
+
+SEARCH_DEBOUNCE_MS = 150
+RESULT_ITEM_CACHE_SIZE = 512
 
 
 class EntryObject(GObject.Object):
@@ -17,13 +25,179 @@ class EntryObject(GObject.Object):
         self.entry = entry
 
 
+class ResultListModel(GObject.Object, Gio.ListModel):
+    
+    def __init__(self):
+        super().__init__()
+        self.catalog = None
+        self.rows = []
+        self._items = OrderedDict()
+    
+    def do_get_item_type(self):
+        return EntryObject
+    
+    def do_get_n_items(self):
+        return len(self.rows)
+    
+    def do_get_item(self, position):
+        if position >= len(self.rows):
+            return None
+        
+        item = self._items.get(position)
+        if item is None:
+            item = EntryObject(TsvEntry(self.catalog, self.rows[position]))
+            self._items[position] = item
+            if len(self._items) > RESULT_ITEM_CACHE_SIZE:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(position)
+        return item
+    
+    def set_rows(self, catalog, rows):
+        removed = len(self.rows)
+        self.catalog = catalog
+        self.rows = rows
+        self._items.clear()
+        self.items_changed(0, removed, len(rows))
+
+
+class DownloadQueuePanel(Gtk.Box):
+    ACTIONS = {
+        "cancel": ("process-stop-symbolic", "Cancel download"),
+        "retry": ("view-refresh-symbolic", "Resume download"),
+        "discard": ("user-trash-symbolic", "Discard download and partial file"),
+        "dismiss": ("window-close-symbolic", "Dismiss"),
+    }
+    
+    def __init__(self, on_row_button):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.on_row_button = on_row_button
+        self.rows = {}
+        
+        header = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        title_label = Gtk.Label(label="Downloads")
+        title_label.add_css_class("heading")
+        title_label.set_xalign(0)
+        title_label.set_hexpand(True)
+        header.append(title_label)
+        
+        self.summary_label = Gtk.Label()
+        self.summary_label.add_css_class("dim-label")
+        header.append(self.summary_label)
+        self.append(header)
+        
+        self.list_box = Gtk.ListBox()
+        self.list_box.set_selection_mode(Gtk.SelectionMode.NONE)
+        self.list_box.add_css_class("boxed-list")
+        
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_max_content_height(200)
+        scrolled.set_propagate_natural_height(True)
+        scrolled.set_child(self.list_box)
+        self.append(scrolled)
+        
+        self.set_visible(False)
+    
+    def set_row(self, row_id, title, info, fraction, actions):
+        row = self.rows.get(row_id)
+        if row is None:
+            row = self._create_row(row_id)
+        
+        row["title"].set_label(title)
+        row["title"].set_tooltip_text(title)
+        row["info"].set_label(info)
+        if fraction is None:
+            row["progress"].pulse()
+        else:
+            row["progress"].set_fraction(fraction)
+        
+        if row["actions"] != actions:
+            self._set_actions(row_id, row, actions)
+    
+    def _set_actions(self, row_id, row, actions):
+        while row["buttons"].get_first_child():
+            row["buttons"].remove(row["buttons"].get_first_child())
+        for action in actions:
+            icon_name, tooltip = self.ACTIONS[action]
+            button = Gtk.Button(icon_name=icon_name, tooltip_text=tooltip)
+            button.add_css_class("flat")
+            button.set_valign(Gtk.Align.CENTER)
+            button.connect("clicked", lambda button, action=action: self.on_row_button(row_id, action))
+            row["buttons"].append(button)
+        row["actions"] = actions
+    
+    def remove_row(self, row_id):
+        row = self.rows.pop(row_id, None)
+        if row:
+            self.list_box.remove(row["row"])
+        self.set_visible(bool(self.rows))
+    
+    def set_summary(self, summary):
+        self.summary_label.set_label(summary)
+    
+    def _create_row(self, row_id):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.set_margin_top(6)
+        box.set_margin_bottom(6)
+        box.set_margin_start(12)
+        box.set_margin_end(6)
+        
+        top = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        title_label = Gtk.Label()
+        title_label.set_xalign(0)
+        title_label.set_hexpand(True)
+        title_label.set_ellipsize(Pango.EllipsizeMode.END)
+        top.append(title_label)
+        
+        info_label = Gtk.Label()
+        info_label.add_css_class("dim-label")
+        top.append(info_label)
+        
+        buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        top.append(buttons)
+        box.append(top)
+        
+        progress = Gtk.ProgressBar()
+        box.append(progress)
+        
+        row = Gtk.ListBoxRow()
+        row.set_activatable(False)
+        row.set_child(box)
+        self.list_box.append(row)
+        
+        self.rows[row_id] = {
+            "row": row,
+            "title": title_label,
+            "info": info_label,
+            "progress": progress,
+            "buttons": buttons,
+            "actions": None,
+        }
+        self.set_visible(True)
+        return self.rows[row_id]
+
+
 class MainWindow(Adw.ApplicationWindow):
+    PLATFORMS = ["PS3", "PSV", "PSP", "PSM", "PSX"]
+    REGIONS = ["US", "EU", "JP", "ASIA", "HK"]
+    
     def __init__(self, config, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.config = config
         self.tsv_parser = TsvParser(config)
         self.current_entries = []
-        self.active_downloads = {}  
+        self.download_queue = DownloadQueue(config, self._on_download_changed, self._on_download_progress)
+        self.download_updates = ProgressCoalescer(self._on_download_updates, widget=self)
+        
+        self._filter_timeout_id = 0
+        self._query_generation = 0
+        self._query_pending = None
+        self._query_cancellable = None
+        self._query_condition = threading.Condition()
+        self._query_lock = threading.Lock()
+        self._query_thread = threading.Thread(target=self._query_worker, daemon=True)
+        self._query_thread.start()
 
         self.set_title("PkgHarbor")
         self.set_default_size(1000, 700)
@@ -84,7 +258,15 @@ class MainWindow(Adw.ApplicationWindow):
         self.search_entry = Gtk.SearchEntry()
         self.search_entry.set_hexpand(True)
         self.search_entry.connect("search-changed", self._on_search_changed)
-        self.search_bar.set_child(self.search_entry)
+        
+        self.fuzzy_button = Gtk.ToggleButton(label="Fuzzy")
+        self.fuzzy_button.set_tooltip_text("Rank the closest matches, tolerating typos")
+        self.fuzzy_button.connect("toggled", self._on_fuzzy_toggled)
+        
+        search_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        search_box.append(self.search_entry)
+        search_box.append(self.fuzzy_button)
+        self.search_bar.set_child(search_box)
         self.search_bar.connect_entry(self.search_entry)
         content_box.append(self.search_bar)
 
@@ -135,6 +317,12 @@ class MainWindow(Adw.ApplicationWindow):
         filter_box.append(region_box)
 
         
+        self.new_button = Gtk.ToggleButton(label="New")
+        self.new_button.set_tooltip_text("Only show entries added by the last refresh")
+        self.new_button.connect("toggled", self._on_new_toggled)
+        filter_box.append(self.new_button)
+
+        
         spacer = Gtk.Box()
         spacer.set_hexpand(True)
         filter_box.append(spacer)
@@ -160,22 +348,25 @@ class MainWindow(Adw.ApplicationWindow):
         scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
 
         
-        self.list_store = Gio.ListStore(item_type=EntryObject)
-        self.selection_model = Gtk.SingleSelection(model=self.list_store)
+        self.result_model = ResultListModel()
+        self.selection_model = Gtk.SingleSelection(model=self.result_model)
 
         
         self.column_view = Gtk.ColumnView(model=self.selection_model)
         self.column_view.set_hexpand(True)
         self.column_view.set_vexpand(True)
         self.column_view.add_css_class("data-table")
+        self.column_view.get_sorter().connect("changed", self._on_sort_changed)
+        self.sort_fields = {}
         
         
-        self._add_column("Name", self._create_name_cell, expand=True)
-        self._add_column("Title ID", self._create_title_id_cell, width=110)
-        self._add_column("Region", self._create_region_cell, width=70)
-        self._add_column("Platform", self._create_platform_cell, width=80)
-        self._add_column("Type", self._create_category_cell, width=80)
-        self._add_column("Size", self._create_size_cell, width=90)
+        self._add_column("Name", self._create_name_cell, expand=True, sort_field="name")
+        self._add_column("Title ID", self._create_title_id_cell, width=110, sort_field="title_id")
+        self._add_column("Region", self._create_region_cell, width=70, sort_field="region")
+        self._add_column("Platform", self._create_platform_cell, width=80, sort_field="platform")
+        self._add_column("Type", self._create_category_cell, width=80, sort_field="category")
+        self._add_column("Size", self._create_size_cell, width=90, sort_field="file_size")
+        self._add_column("Modified", self._create_modified_cell, width=150, sort_field="last_modified")
         self._add_button_column("", self._setup_download_button, self._bind_download_button, width=50)
 
         scrolled.set_child(self.column_view)
@@ -198,19 +389,11 @@ class MainWindow(Adw.ApplicationWindow):
         self.status_label.add_css_class("dim-label")
         status_row.append(self.status_label)
         
-        
-        self.download_info_label = Gtk.Label()
-        self.download_info_label.add_css_class("dim-label")
-        self.download_info_label.set_visible(False)
-        status_row.append(self.download_info_label)
-        
         self.status_bar.append(status_row)
         
         
-        self.download_progress = Gtk.ProgressBar()
-        self.download_progress.set_visible(False)
-        self.download_progress.set_show_text(False)
-        self.status_bar.append(self.download_progress)
+        self.download_panel = DownloadQueuePanel(self._on_download_row_button)
+        self.status_bar.append(self.download_panel)
         
         content_box.append(self.status_bar)
 
@@ -232,8 +415,11 @@ class MainWindow(Adw.ApplicationWindow):
         
         
         self._populate_filters()
+        
+        self.connect("close-request", self._on_close_request)
+        self.download_queue.restore()
     
-    def _add_column(self, title, factory_func, width=None, expand=False):
+    def _add_column(self, title, factory_func, width=None, expand=False, sort_field=None):
         factory = Gtk.SignalListItemFactory()
         factory.connect("setup", self._on_factory_setup)
         factory.connect("bind", factory_func)
@@ -241,6 +427,10 @@ class MainWindow(Adw.ApplicationWindow):
         column = Gtk.ColumnViewColumn(title=title, factory=factory)
         column.set_resizable(True)
         
+        if sort_field:
+            column.set_sorter(Gtk.CustomSorter())
+            self.sort_fields[column] = sort_field
+        
         if expand:
             column.set_expand(True)
         elif width:
@@ -332,11 +522,6 @@ class MainWindow(Adw.ApplicationWindow):
     
     def _on_download_clicked(self, button, entry):
         
-        if self.active_downloads:
-            self.show_toast("A download is already in progress")
-            return
-        
-        
         download_dir = self.config.get_download_directory()
         if not download_dir:
             self.show_toast("Please configure a download directory first")
@@ -366,151 +551,132 @@ class MainWindow(Adw.ApplicationWindow):
                 self.show_toast(f"Error: {e}")
     
     def _start_download(self, entry, dest_path):
-        self.update_status(f"Downloading: {entry.name}")
-        
-        
-        self.download_progress.set_visible(True)
-        self.download_progress.set_fraction(0.0)
-        self.download_info_label.set_visible(True)
-        self.download_info_label.set_label("Starting...")
-        
-        
-        try:
-            total_size = int(entry.file_size) if entry.file_size else 0
-        except ValueError:
-            total_size = 0
-        
-        
-        session = Soup.Session()
-        message = Soup.Message.new("GET", entry.pkg_url)
-        
-        if message is None:
-            self.show_toast(f"Invalid URL for {entry.name}")
-            self._hide_progress()
+        job = self.download_queue.find(dest_path)
+        if job and job["state"] == "failed":
+            self.download_queue.retry(job["id"])
             return
-        
-        
-        download_id = entry.content_id or entry.title_id
-        self.active_downloads[download_id] = {
-            "entry": entry,
-            "dest_path": dest_path,
-            "session": session,
-            "total_size": total_size,
-            "downloaded": 0,
-            "file": None,
-            "cancellable": Gio.Cancellable(),
-            "type": "pkg"
-        }
-        
-        
-        session.send_async(
-            message,
-            GLib.PRIORITY_DEFAULT,
-            self.active_downloads[download_id]["cancellable"],
-            self._on_send_complete,
-            download_id,
-            message
-        )
-    
-    def _on_send_complete(self, session, result, download_id, message):
-        if download_id not in self.active_downloads:
+        if job:
+            self.show_toast(f"{entry.name} is already queued")
             return
         
-        download_info = self.active_downloads[download_id]
-        
-        try:
-            input_stream = session.send_finish(result)
-            
-            if message.get_status() != Soup.Status.OK:
-                self.show_toast(f"Download failed: HTTP {message.get_status()}")
-                self._download_cleanup(download_id)
-                return
-            
-            
-            if download_info["total_size"] == 0:
-                content_length = message.get_response_headers().get_content_length()
-                if content_length > 0:
-                    download_info["total_size"] = content_length
-            
-            
-            download_info["file"] = open(download_info["dest_path"], "wb")
-            download_info["input_stream"] = input_stream
-            
-            
-            self._read_chunk(download_id)
-            
-        except Exception as e:
-            self.show_toast(f"Download error: {e}")
-            self._download_cleanup(download_id)
-    
-    def _read_chunk(self, download_id):
-        if download_id not in self.active_downloads:
+        expected = entry.sha256.strip().lower()
+        if expected and self.download_queue.get_cached_hash(dest_path) == expected:
+            self.show_toast(f"{entry.name} is already downloaded and verified")
             return
         
-        download_info = self.active_downloads[download_id]
-        input_stream = download_info["input_stream"]
-        
-        
-        input_stream.read_bytes_async(
-            65536,
-            GLib.PRIORITY_DEFAULT,
-            download_info["cancellable"],
-            self._on_chunk_read,
-            download_id
-        )
+        self.download_queue.add("pkg", entry, entry.pkg_url, dest_path, entry.get_file_size())
     
-    def _on_chunk_read(self, input_stream, result, download_id):
-        if download_id not in self.active_downloads:
-            return
-        
-        download_info = self.active_downloads[download_id]
-        
-        try:
-            gbytes = input_stream.read_bytes_finish(result)
-            data = gbytes.get_data()
-            
-            if data and len(data) > 0:
-                
-                download_info["file"].write(data)
-                download_info["downloaded"] += len(data)
-                
-                
-                self._update_download_progress(download_id)
-                
-                
-                self._read_chunk(download_id)
+    def _on_download_changed(self, job):
+        self.download_updates.discard(job["id"])
+        self._update_download_row(job)
+        self._update_download_summary()
+        entry = job["entry"]
+        
+        if job["state"] == "active":
+            self.update_status(f"Downloading: {entry.name}")
+        elif job["state"] == "done":
+            if job["type"] == "pkg":
+                if job["verified"] is False:
+                    self.show_toast(f"Checksum mismatch: {entry.name} may be corrupted")
+                else:
+                    self.show_toast(f"Downloaded: {entry.name}")
+                self._handle_rap_download(entry, job["dest_path"])
             else:
-                
-                self._download_complete(download_id)
-                
-        except Exception as e:
-            self.show_toast(f"Download error: {e}")
-            self._download_cleanup(download_id)
+                self.update_status(f"Downloaded {entry.name} with RAP")
+            GLib.timeout_add(2000, self._remove_download_row, job["id"])
+        elif job["state"] == "failed":
+            self.show_toast(f"Download error: {job['error']}")
+            self.update_status(f"Download failed: {entry.name}")
+        elif job["state"] == "cancelled":
+            self.update_status(f"Download cancelled: {entry.name}")
+            self._remove_download_row(job["id"])
+    
+    def _on_download_progress(self, job):
+        self.download_updates.rate = self.config.get_progress_update_rate()
+        self.download_updates.mark(job["id"])
+    
+    def _on_download_updates(self, updates):
+        for job_id in updates:
+            job = self.download_queue.jobs.get(job_id)
+            if job:
+                self._update_download_row(job)
+        self._update_download_summary()
     
-    def _update_download_progress(self, download_id):
-        if download_id not in self.active_downloads:
+    def _update_download_row(self, job):
+        if job["id"] not in self.download_queue.jobs:
             return
         
-        download_info = self.active_downloads[download_id]
-        downloaded = download_info["downloaded"]
-        total_size = download_info["total_size"]
-        file_type = download_info.get("type", "pkg").upper()
+        state = job["state"]
+        downloaded = job["downloaded"]
+        total_size = job["total_size"]
+        fraction = 0.0
         
-        if total_size > 0:
+        if state == "queued":
+            info = "Queued"
+        elif state == "active" and total_size > 0:
             fraction = min(downloaded / total_size, 1.0)
-            self.download_progress.set_fraction(fraction)
-            
-            
-            downloaded_str = self._format_size(downloaded)
-            total_str = self._format_size(total_size)
-            percent = int(fraction * 100)
-            
-            self.download_info_label.set_label(f"[{file_type}] {downloaded_str} / {total_str} ({percent}%)")
+            speed = self._format_size(self.download_queue.get_speed(job))
+            info = f"{self._format_size(downloaded)} / {self._format_size(total_size)} ({int(fraction * 100)}%) - {speed}/s"
+            eta = self.download_queue.get_eta(job)
+            if eta is not None:
+                info += f", {self._format_eta(eta)} left"
+        elif state == "active":
+            fraction = None
+            info = f"{self._format_size(downloaded)} downloaded"
+        elif state == "closing":
+            fraction = min(downloaded / total_size, 1.0) if total_size > 0 else None
+            info = "Finishing..."
+        elif state == "done" and job["verified"] is False:
+            fraction = 1.0
+            info = "Complete, checksum mismatch!"
+        elif state == "done" and job["verified"]:
+            fraction = 1.0
+            info = "Complete, checksum verified"
+        elif state == "done":
+            fraction = 1.0
+            info = "Complete!"
+        elif state == "failed":
+            fraction = min(downloaded / total_size, 1.0) if total_size > 0 else 0.0
+            info = f"Failed: {job['error']}"
         else:
-            
-            self.download_progress.pulse()
-            downloaded_str = self._format_size(downloaded)
-            self.download_info_label.set_label(f"[{file_type}] {downloaded_str} downloaded")
+            info = "Cancelled"
+        
+        if state in ("queued", "active"):
+            actions = ("cancel",)
+        elif state == "failed":
+            actions = ("retry", "discard")
+        elif state == "closing":
+            actions = ()
+        else:
+            actions = ("dismiss",)
+        
+        title = f"[{job['type'].upper()}] {job['entry'].name}"
+        self.download_panel.set_row(job["id"], title, info, fraction, actions)
+    
+    def _update_download_summary(self):
+        active, queued = self.download_queue.get_counts()
+        summary = f"{active} active, {queued} queued"
+        if active:
+            summary += f" - {self._format_size(self.download_queue.get_throughput())}/s"
+        self.download_panel.set_summary(summary)
+    
+    def _on_download_row_button(self, job_id, action):
+        if action in ("cancel", "discard"):
+            self.download_queue.cancel(job_id)
+        elif action == "retry":
+            self.download_queue.retry(job_id)
+        else:
+            self._remove_download_row(job_id)
+    
+    def _on_close_request(self, window):
+        self.download_queue.save_journal(wait=True)
+        return False
+    
+    def _remove_download_row(self, job_id):
+        self.download_queue.remove(job_id)
+        self.download_panel.remove_row(job_id)
+        self._update_download_summary()
+        return False
     
     def _format_size(self, size):
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -519,44 +685,13 @@ class MainWindow(Adw.ApplicationWindow):
             size /= 1024
         return f"{size:.1f} TB"
     
-    def _download_complete(self, download_id):
-        if download_id not in self.active_downloads:
-            return
-        
-        download_info = self.active_downloads[download_id]
-        entry = download_info["entry"]
-        download_type = download_info.get("type", "pkg")
-        
-        
-        if download_info["file"]:
-            download_info["file"].close()
-        
-        
-        if "input_stream" in download_info:
-            download_info["input_stream"].close(None)
-        
-        if download_type == "pkg":
-            
-            self.download_progress.set_fraction(1.0)
-            self.show_toast(f"Downloaded: {entry.name}")
-            
-            
-            pkg_dest_path = download_info["dest_path"]
-            del self.active_downloads[download_id]
-            
-            
-            self._handle_rap_download(entry, pkg_dest_path)
-        else:
-            
-            self.download_progress.set_fraction(1.0)
-            self.download_info_label.set_label("Complete!")
-            self.update_status(f"Downloaded {entry.name} with RAP")
-            
-            
-            del self.active_downloads[download_id]
-            
-            
-            GLib.timeout_add(2000, self._hide_progress)
+    def _format_eta(self, seconds):
+        seconds = int(seconds)
+        if seconds < 60:
+            return f"{seconds}s"
+        if seconds < 3600:
+            return f"{seconds // 60}m {seconds % 60:02d}s"
+        return f"{seconds // 3600}h {seconds // 60 % 60:02d}m"
     
     def _handle_rap_download(self, entry, pkg_dest_path):
         rap_status, rap_value = self._get_rap_status(entry)
@@ -604,7 +739,6 @@ class MainWindow(Adw.ApplicationWindow):
         else:
             
             self.update_status(f"Downloaded {entry.name}")
-            GLib.timeout_add(2000, self._hide_progress)
     
     def _show_rap_info_dialog(self, entry, title, message, pkg_dest_path):
         dialog = Adw.AlertDialog()
@@ -615,7 +749,6 @@ class MainWindow(Adw.ApplicationWindow):
         dialog.choose(self, None, self._on_rap_dialog_closed, entry)
         
         self.update_status(f"Downloaded {entry.name}")
-        GLib.timeout_add(2000, self._hide_progress)
     
     def _on_rap_dialog_closed(self, dialog, result, entry):
         try:
@@ -629,76 +762,7 @@ class MainWindow(Adw.ApplicationWindow):
         rap_filename = f"{entry.content_id}.rap"
         rap_dest_path = os.path.join(pkg_dir, rap_filename)
         
-        self.update_status(f"Downloading RAP: {entry.name}")
-        self.download_progress.set_fraction(0.0)
-        self.download_info_label.set_label("Downloading RAP...")
-        
-        
-        session = Soup.Session()
-        message = Soup.Message.new("GET", rap_url)
-        
-        if message is None:
-            self._show_rap_info_dialog(
-                entry,
-                "RAP Download Error",
-                f"Invalid RAP URL for \"{entry.name}\".",
-                pkg_dest_path
-            )
-            return
-        
-        
-        download_id = f"{entry.content_id or entry.title_id}_rap"
-        self.active_downloads[download_id] = {
-            "entry": entry,
-            "dest_path": rap_dest_path,
-            "session": session,
-            "total_size": 0,  
-            "downloaded": 0,
-            "file": None,
-            "cancellable": Gio.Cancellable(),
-            "type": "rap",
-            "pkg_dest_path": pkg_dest_path
-        }
-        
-        
-        session.send_async(
-            message,
-            GLib.PRIORITY_DEFAULT,
-            self.active_downloads[download_id]["cancellable"],
-            self._on_send_complete,
-            download_id,
-            message
-        )
-    
-    def _download_cleanup(self, download_id):
-        if download_id not in self.active_downloads:
-            return
-        
-        download_info = self.active_downloads[download_id]
-        entry = download_info["entry"]
-        
-        
-        if download_info.get("file"):
-            download_info["file"].close()
-        
-        
-        if download_info.get("input_stream"):
-            try:
-                download_info["input_stream"].close(None)
-            except:
-                pass
-        
-        self.update_status(f"Download failed: {entry.name}")
-        
-        
-        del self.active_downloads[download_id]
-        
-        self._hide_progress()
-    
-    def _hide_progress(self):
-        self.download_progress.set_visible(False)
-        self.download_info_label.set_visible(False)
-        return False  
+        self.download_queue.add("rap", entry, rap_url, rap_dest_path, front=True)
     
     def _create_name_cell(self, factory, list_item):
         label = list_item.get_child()
@@ -737,6 +801,12 @@ class MainWindow(Adw.ApplicationWindow):
         if item:
             label.set_label(item.entry.get_file_size_formatted())
     
+    def _create_modified_cell(self, factory, list_item):
+        label = list_item.get_child()
+        item = list_item.get_item()
+        if item:
+            label.set_label(item.entry.last_modified)
+    
     def _populate_filters(self):
         
         self.category_model.splice(0, self.category_model.get_n_items(), [])
@@ -755,8 +825,7 @@ class MainWindow(Adw.ApplicationWindow):
         self.platform_model.append("All Consoles")
         
         
-        platforms = ["PS3", "PSV", "PSP", "PSM", "PSX"]
-        for platform in platforms:
+        for platform in self.PLATFORMS:
             self.platform_model.append(platform)
     
     def _update_region_filter(self):
@@ -764,21 +833,46 @@ class MainWindow(Adw.ApplicationWindow):
         self.region_model.append("All Regions")
         
         
-        regions = ["US", "EU", "JP", "ASIA", "HK"]
-        for region in regions:
+        for region in self.REGIONS:
             self.region_model.append(region)
     
     def _on_filter_changed(self, dropdown, param):
         self._apply_filters()
     
+    def _on_sort_changed(self, sorter, change):
+        self._apply_filters()
+    
+    def _get_sort(self):
+        sorter = self.column_view.get_sorter()
+        column = sorter.get_primary_sort_column()
+        if column not in self.sort_fields:
+            return None, False
+        return self.sort_fields[column], sorter.get_primary_sort_order() == Gtk.SortType.DESCENDING
+    
     def _on_search_toggled(self, button):
         self.search_bar.set_search_mode(button.get_active())
         if button.get_active():
             self.search_entry.grab_focus()
     
     def _on_search_changed(self, entry):
+        self._schedule_filters(SEARCH_DEBOUNCE_MS)
+    
+    def _on_fuzzy_toggled(self, button):
+        self._apply_filters()
+    
+    def _on_new_toggled(self, button):
         self._apply_filters()
     
+    def _schedule_filters(self, delay):
+        if self._filter_timeout_id:
+            GLib.source_remove(self._filter_timeout_id)
+        self._filter_timeout_id = GLib.timeout_add(delay, self._on_filter_timeout)
+    
+    def _on_filter_timeout(self):
+        self._filter_timeout_id = 0
+        self._apply_filters()
+        return False
+    
     def _get_selected_category(self):
         selected = self.category_dropdown.get_selected()
         if selected == 0 or selected == Gtk.INVALID_LIST_POSITION:
@@ -795,9 +889,8 @@ class MainWindow(Adw.ApplicationWindow):
         if selected == 0 or selected == Gtk.INVALID_LIST_POSITION:
             return "all"
         
-        platforms = ["PS3", "PSV", "PSP", "PSM", "PSX"]
-        if selected - 1 < len(platforms):
-            return platforms[selected - 1]
+        if selected - 1 < len(self.PLATFORMS):
+            return self.PLATFORMS[selected - 1]
         return "all"
     
     def _get_selected_region(self):
@@ -805,26 +898,99 @@ class MainWindow(Adw.ApplicationWindow):
         if selected == 0 or selected == Gtk.INVALID_LIST_POSITION:
             return "all"
         
-        regions = ["US", "EU", "JP", "ASIA", "HK"]
-        if selected - 1 < len(regions):
-            return regions[selected - 1]
+        if selected - 1 < len(self.REGIONS):
+            return self.REGIONS[selected - 1]
         return "all"
     
     def _apply_filters(self):
+        if self._filter_timeout_id:
+            GLib.source_remove(self._filter_timeout_id)
+            self._filter_timeout_id = 0
+        
         category = self._get_selected_category()
         platform = self._get_selected_platform()
         region = self._get_selected_region()
         search_text = self.search_entry.get_text()
+        sort_field, descending = self._get_sort()
+        fuzzy = self.fuzzy_button.get_active()
+        new_only = self.new_button.get_active()
+        
+        if self._query_cancellable:
+            self._query_cancellable.cancel()
+        self._query_cancellable = Gio.Cancellable()
+        
+        with self._query_condition:
+            self._query_generation += 1
+            self._query_pending = (
+                self._query_generation, self._query_cancellable,
+                category, platform, search_text, region, sort_field, descending, fuzzy, new_only
+            )
+            self._query_condition.notify()
+    
+    def _query_worker(self):
+        while True:
+            with self._query_condition:
+                while self._query_pending is None:
+                    self._query_condition.wait()
+                (generation, cancellable, category, platform, search_text, region,
+                 sort_field, descending, fuzzy, new_only) = self._query_pending
+                self._query_pending = None
+            
+            with self._query_lock:
+                if cancellable.is_cancelled():
+                    continue
+                try:
+                    catalog = self.tsv_parser.catalog
+                    if fuzzy:
+                        rows = self.tsv_parser.fuzzy_query(category, platform, search_text, region,
+                                                           cancellable=cancellable, new_only=new_only)
+                    else:
+                        rows = self.tsv_parser.query(category, platform, search_text, region, cancellable, new_only)
+                    if sort_field:
+                        rows = self.tsv_parser.sort_rows(rows, sort_field, descending)
+                    if fuzzy and search_text:
+                        counts = self.tsv_parser.get_facet_counts(cancellable=cancellable, rows=rows)
+                    else:
+                        counts = self.tsv_parser.get_facet_counts(category, platform, search_text, region, cancellable,
+                                                                  new_only)
+                except QueryCancelled:
+                    continue
+                except Exception as e:
+                    print(f"Error running query: {e}")
+                    continue
+            
+            GLib.idle_add(self._publish_results, generation, catalog, rows, counts)
+    
+    def _publish_results(self, generation, catalog, rows, counts):
+        if generation != self._query_generation:
+            return False
+        
+        self.result_model.set_rows(catalog, rows)
+        self.results_label.set_label(f"{len(rows)} items")
+        self._update_facet_counts(counts)
+        return False
+    
+    def _update_facet_counts(self, counts):
+        categories = [(key, info["label"]) for key, info in Config.TSV_STRUCTURE.items()]
+        self._set_dropdown_labels(self.category_dropdown, self.category_model, "All Types", categories, counts["category"])
         
-        entries = self.tsv_parser.get_entries(category, platform, search_text, region)
-        
-        
-        self.list_store.remove_all()
-        for entry in entries:
-            self.list_store.append(EntryObject(entry))
+        platforms = [(platform, platform) for platform in self.PLATFORMS]
+        self._set_dropdown_labels(self.platform_dropdown, self.platform_model, "All Consoles", platforms, counts["platform"])
         
+        regions = [(region, region) for region in self.REGIONS]
+        self._set_dropdown_labels(self.region_dropdown, self.region_model, "All Regions", regions, counts["region"])
         
-        self.results_label.set_label(f"{len(entries)} items")
+        self.new_button.set_label(f"New ({counts['new']:,})")
+    
+    def _set_dropdown_labels(self, dropdown, model, all_label, options, counts):
+        labels = [f"{all_label} ({counts.get('all', 0):,})"]
+        labels += [f"{label} ({counts.get(value, 0):,})" for value, label in options]
+        
+        selected = dropdown.get_selected()
+        dropdown.handler_block_by_func(self._on_filter_changed)
+        model.splice(0, model.get_n_items(), labels)
+        dropdown.set_selected(selected)
+        dropdown.handler_unblock_by_func(self._on_filter_changed)
     
     def load_data(self):
         self.update_status("Loading data...")
@@ -833,11 +999,15 @@ class MainWindow(Adw.ApplicationWindow):
         GLib.idle_add(self._load_data_async)
     
     def _load_data_async(self):
-        self.tsv_parser.load_all()
+        with self._query_lock:
+            self.tsv_parser.load_all()
         self._apply_filters()
         
-        total = len(self.tsv_parser.entries)
-        if total > 0:
+        total = len(self.tsv_parser.catalog)
+        new_count = self.tsv_parser.get_new_count()
+        if total > 0 and new_count:
+            self.update_status(f"Loaded {total} entries from cache ({new_count} new since last refresh)")
+        elif total > 0:
             self.update_status(f"Loaded {total} entries from cache")
         else:
             self.update_status("No data loaded. Configure TSV sources in the menu.")
@@ -847,6 +1017,29 @@ class MainWindow(Adw.ApplicationWindow):
         
         return False  
     
+    def feed_tsv(self, category, platform, data):
+        with self._query_lock:
+            updated = self.tsv_parser.feed_stream((category, platform), data)
+        if updated:
+            self._on_streamed_rows()
+    
+    def finish_tsv(self, category, platform, local_path):
+        with self._query_lock:
+            updated = self.tsv_parser.finish_stream((category, platform), local_path)
+        if updated:
+            self._on_streamed_rows()
+    
+    def abort_tsv(self, category, platform):
+        with self._query_lock:
+            updated = self.tsv_parser.abort_stream((category, platform))
+        if updated:
+            self._on_streamed_rows()
+    
+    def _on_streamed_rows(self):
+        self._apply_filters()
+        self.update_status(f"Loading... {len(self.tsv_parser.catalog)} entries so far")
+        self.main_stack.set_visible_child_name("content")
+    
     def show_toast(self, message):
         toast = Adw.Toast(title=message)
         self.toast_overlay.add_toast(toast)